@@ -1,7 +1,10 @@
 from characterai.characterai import PyCAI, PyAsyncCAI
+from characterai.catalog import CharacterCatalog
+from characterai.context import ContextTracker
+from characterai.sharding import ShardedCAI
 import logging
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
 del logging
-__all__ = ['PyCAI', 'PyAsyncCAI']
\ No newline at end of file
+__all__ = ['PyCAI', 'PyAsyncCAI', 'CharacterCatalog', 'ContextTracker', 'ShardedCAI']
\ No newline at end of file
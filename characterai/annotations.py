@@ -0,0 +1,201 @@
+import asyncio
+
+from characterai import errors, protocol
+from characterai.ratelimit import RateLimiter
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["AnnotationQueue"]
+
+
+class AnnotationQueue:
+    """Ratings submitted in the background
+
+    queue = AnnotationQueue(client, rate=5)
+    queue.rate(3, 'HISTORY_ID', 'MESSAGE_ID')
+    queue.rate2(4, 'CHAT_ID', 'TURN_ID', 'CANDIDATE_ID')
+    await queue.flush()
+    await queue.close()
+
+    rate() and rate2() return immediately. Ratings are sent through
+    client.chat.rate and client.chat2.rate by `concurrency` workers
+    under a shared rate limit. Rating the same message again before
+    it was sent replaces the pending rating. Failed submissions are
+    retried with exponential backoff and end up in `failed`.
+
+    Works with PyAsyncCAI and with PyCAI, whose blocking calls run in
+    a worker thread; PyCAI has no chat2.rate, so only rate() there.
+
+    """
+
+    def __init__(
+        self,
+        client,
+        *,
+        rate: float = 10,
+        burst: float = None,
+        concurrency: int = 4,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.client = client
+        self.limiter = RateLimiter(rate, burst)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.failed = []
+
+        self._pending = {}
+        self._queue = None
+        self._workers = []
+        self._unfinished = 0
+        # every queued rating gets a ticket, all up to _finished are done
+        self._tickets = 0
+        self._finished = 0
+        self._done = set()
+        self._flushes = []
+        self._closed = False
+
+    def __len__(self):
+        return self._unfinished
+
+    def rate(
+        self,
+        rate: int,
+        history_id: str,
+        message_id: str,
+        *,
+        token: str = None,
+        **kwargs,
+    ):
+        if rate not in protocol.RATE_LABELS:
+            raise errors.LabelError("Wrong Rate Value")
+        self._put(
+            ("chat", history_id, message_id),
+            self.client.chat.rate,
+            (rate, history_id, message_id),
+            {"token": token, **kwargs},
+        )
+
+    def rate2(
+        self,
+        rate: int,
+        chat_id: str,
+        turn_id: str,
+        candidate_id: str,
+        *,
+        token: str = None,
+    ):
+        if rate not in protocol.STARS:
+            raise errors.LabelError("Wrong Rate Value")
+        call = getattr(self.client.chat2, "rate", None)
+        if call is None:
+            raise errors.PyCAIError("The client has no chat2.rate")
+        self._put(
+            ("chat2", chat_id, turn_id, candidate_id),
+            call,
+            (rate, chat_id, turn_id, candidate_id),
+            {"token": token},
+        )
+
+    async def flush(self):
+        """Wait until everything submitted so far was sent or gave up
+
+        Ratings submitted while waiting are not waited for.
+        """
+        mark = self._tickets
+        if self._finished >= mark:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._flushes.append((mark, waiter))
+        await waiter
+
+    async def close(self):
+        self._closed = True
+        await self.flush()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    def _put(self, key: tuple, call, args: tuple, kwargs: dict):
+        if self._closed:
+            raise errors.PyCAIError("AnnotationQueue is closed")
+        self._start()
+        self.submitted += 1
+
+        if key in self._pending:
+            self.coalesced += 1
+            ticket = self._pending[key][0]
+            self._pending[key] = (ticket, call, args, kwargs)
+            return
+
+        self._tickets += 1
+        self._pending[key] = (self._tickets, call, args, kwargs)
+        self._unfinished += 1
+        self._queue.put_nowait(key)
+
+    def _start(self):
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.ensure_future(self._work()) for _ in range(self.concurrency)
+        ]
+
+    async def _work(self):
+        while True:
+            key = await self._queue.get()
+            ticket, call, args, kwargs = self._pending.pop(key)
+            try:
+                await self._submit(key, call, args, kwargs)
+            finally:
+                self._unfinished -= 1
+                self._finish(ticket)
+
+    def _finish(self, ticket: int):
+        self._done.add(ticket)
+        while self._finished + 1 in self._done:
+            self._finished += 1
+            self._done.discard(self._finished)
+        waiting = []
+        for mark, waiter in self._flushes:
+            if mark > self._finished:
+                waiting.append((mark, waiter))
+            elif not waiter.done():
+                waiter.set_result(None)
+        self._flushes = waiting
+
+    async def _submit(self, key: tuple, call, args: tuple, kwargs: dict):
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire()
+            try:
+                if asyncio.iscoroutinefunction(call):
+                    await call(*args, **kwargs)
+                else:
+                    await asyncio.to_thread(call, *args, **kwargs)
+            except (errors.AuthError, errors.LabelError) as e:
+                self.failed.append((key, e))
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    _log.debug(f"Giving up rating {key}: {e!r}")
+                    self.failed.append((key, e))
+                    return
+                await asyncio.sleep(self.backoff * 2**attempt)
+            else:
+                self.sent += 1
+                return
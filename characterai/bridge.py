@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+from characterai import errors
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["LoopThread"]
+
+
+class LoopThread:
+    """Event loop in a daemon thread that any thread can submit work to
+
+    bridge = LoopThread()
+    result = bridge.run(coroutine)
+    for item in bridge.iterate(async_generator):
+        ...
+    bridge.stop()
+
+    """
+
+    def __init__(self, name: str = "characterai-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def run(self, coro, timeout: float = None):
+        """Run coro on the loop and block until it finishes"""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise errors.PyCAIError("Cannot block the bridge loop from itself")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # timeouts and KeyboardInterrupt in the caller cancel the task
+            future.cancel()
+            raise
+
+    def iterate(self, agen):
+        """Blocking iterator over an async generator running on the loop"""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+    def stop(self):
+        if not self.running:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
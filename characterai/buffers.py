@@ -0,0 +1,139 @@
+from collections import deque
+import asyncio
+
+__all__ = ["BoundedBuffer"]
+
+
+class BoundedBuffer:
+    """FIFO of at most `maxsize` items with an explicit overflow policy
+
+    buffer = BoundedBuffer(64, 'coalesce', key=lambda frame: frame['id'])
+    await buffer.put(frame)
+    frame = await buffer.get()
+
+    When the buffer is full, 'block' makes put() wait for room,
+    'coalesce' replaces the buffered item with the same key(item), for
+    snapshots where only the latest one matters, and waits like
+    'block' when there is none or key() returns None, and 'drop'
+    discards the new item and counts it. Items put with force=True are
+    always accepted, they carry errors and end markers. After close()
+    put() discards its item instead of waiting.
+
+    """
+
+    policies = ("block", "coalesce", "drop")
+
+    def __init__(self, maxsize: int = 64, policy: str = "block", key=None):
+        if policy not in self.policies:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+
+        self.dropped = 0
+        self.coalesced = 0
+        self.high = 0
+        self.closed = False
+
+        self._items = deque()
+        self._getters = deque()
+        self._putters = deque()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def full(self):
+        return len(self._items) >= self.maxsize
+
+    def _wake(self, waiters: deque):
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _append(self, key, item):
+        self._items.append((key, item))
+        if len(self._items) > self.high:
+            self.high = len(self._items)
+        self._wake(self._getters)
+
+    def _key(self, item):
+        if self.policy != "coalesce" or self.key is None:
+            return None
+        return self.key(item)
+
+    def offer(self, item):
+        """Put without waiting, False if the item has to wait for room"""
+        key = self._key(item)
+        if len(self._items) < self.maxsize:
+            self._append(key, item)
+            return True
+        if self.policy == "drop":
+            self.dropped += 1
+            return True
+        if key is not None:
+            for index in range(len(self._items) - 1, -1, -1):
+                if self._items[index][0] == key:
+                    self._items[index] = (key, item)
+                    self.coalesced += 1
+                    return True
+        return False
+
+    def put_nowait(self, item, *, force: bool = False):
+        if force:
+            self._append(None, item)
+        elif not self.offer(item):
+            raise asyncio.QueueFull
+
+    async def put(self, item):
+        while not self.closed and not self.offer(item):
+            waiter = asyncio.get_running_loop().create_future()
+            self._putters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                waiter.cancel()
+                if not self.full():
+                    self._wake(self._putters)
+                raise
+
+    def get_nowait(self):
+        if not self._items:
+            raise asyncio.QueueEmpty
+        _, item = self._items.popleft()
+        self._wake(self._putters)
+        return item
+
+    async def get(self):
+        while not self._items:
+            waiter = asyncio.get_running_loop().create_future()
+            self._getters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                waiter.cancel()
+                if self._items:
+                    self._wake(self._getters)
+                raise
+        return self.get_nowait()
+
+    def clear(self):
+        """Discard the buffered items and release every waiting put()"""
+        self._items.clear()
+        while self._putters:
+            self._wake(self._putters)
+
+    def close(self):
+        """clear() for good, nobody reads the items of later put() calls"""
+        self.closed = True
+        self.clear()
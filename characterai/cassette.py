@@ -0,0 +1,235 @@
+from collections import deque
+import asyncio
+import gzip
+import itertools
+import json
+import re
+import time
+
+from characterai import errors
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["Cassette"]
+
+_REQUEST_ID = re.compile(r'"request_id"\s*:\s*"([^"]*)"')
+
+
+def _key(method: str, link: str, data):
+    body = json.dumps(data, sort_keys=True) if data is not None else ""
+    return f"{method} {link} {body}"
+
+
+class RecordedResponse:
+    """Stand-in for a tls_client response during replay"""
+
+    def __init__(self, status_code: int, text: str, elapsed: float = 0):
+        self.status_code = status_code
+        self.text = text
+        self.elapsed = elapsed
+
+    def json(self):
+        return json.loads(self.text)
+
+    def __repr__(self):
+        return f"<RecordedResponse [{self.status_code}]>"
+
+
+class RecordingWebSocket:
+    """Forwards to a real websocket and writes every frame to the cassette"""
+
+    def __init__(self, ws, cassette, conn: int):
+        self.ws = ws
+        self.cassette = cassette
+        self.conn = conn
+
+    @property
+    def open(self):
+        return getattr(self.ws, "open", True)
+
+    async def send(self, message):
+        self.cassette._frame(self.conn, "send", message)
+        await self.ws.send(message)
+
+    async def recv(self):
+        message = await self.ws.recv()
+        self.cassette._frame(self.conn, "recv", message)
+        return message
+
+    async def close(self):
+        await self.ws.close()
+
+
+class ReplayWebSocket:
+    """Plays back the recorded frames of one connection
+
+    A received frame is released only after as many commands have been
+    sent as preceded it in the recording. Request ids of the replayed
+    commands are mapped onto the recorded ones, so the frame router
+    matches replies exactly as it did live.
+
+    """
+
+    def __init__(self, events: list, speed: float = None):
+        self.speed = speed
+        self._sent = 0
+        self._ids = {}
+        self._recorded_sends = [e for e in events if e["dir"] == "send"]
+        self._recvs = deque()
+        sends = 0
+        previous = 0
+        for event in events:
+            if event["dir"] == "send":
+                sends += 1
+            else:
+                self._recvs.append((sends, event["at"] - previous, event["data"]))
+            previous = event["at"]
+        self._progress = asyncio.Event()
+        self.open = True
+
+    async def send(self, message):
+        if self._sent < len(self._recorded_sends):
+            recorded = _REQUEST_ID.search(self._recorded_sends[self._sent]["data"])
+            current = _REQUEST_ID.search(message)
+            if recorded and current:
+                self._ids[recorded.group(1)] = current.group(1)
+        self._sent += 1
+        self._progress.set()
+
+    async def recv(self):
+        if not self._recvs:
+            # nothing more was recorded, behave like a silent server
+            await asyncio.Event().wait()
+
+        needs, gap, data = self._recvs[0]
+        while self._sent < needs:
+            self._progress.clear()
+            await self._progress.wait()
+        self._recvs.popleft()
+
+        if self.speed:
+            await asyncio.sleep(gap / self.speed)
+
+        match = _REQUEST_ID.search(data)
+        if match and match.group(1) in self._ids:
+            data = data[: match.start(1)] + self._ids[match.group(1)] + data[match.end(1) :]
+        return data
+
+    async def close(self):
+        self.open = False
+
+
+class Cassette:
+    """Record and replay of HTTP exchanges and websocket frames
+
+    cassette = Cassette('bot.cassette', mode='record')
+    client = PyAsyncCAI('TOKEN', cassette=cassette)
+    ...
+    cassette.save()
+
+    cassette = Cassette('bot.cassette', mode='replay', speed=None)
+    client = PyAsyncCAI('TOKEN', cassette=cassette)
+
+    The file is gzip-compressed JSON lines. HTTP responses are replayed
+    by method, URL and body, in recorded order; websocket connections
+    are replayed in the order they were opened. speed=1 keeps recorded
+    timing, speed=None replays as fast as possible. Tokens and headers
+    are never written.
+
+    """
+
+    def __init__(self, path: str, mode: str = "replay", *, speed: float = 1):
+        if mode not in ("record", "replay"):
+            raise ValueError("mode must be 'record' or 'replay'")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+
+        self._events = []
+        self._http = {}
+        self._connections = deque()
+        self._conn_ids = itertools.count()
+        self._opened = {}
+
+        if mode == "replay":
+            self.load()
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf8") as f:
+            events = [json.loads(line) for line in f if line.strip()]
+
+        connections = {}
+        for event in events:
+            if event["t"] == "http":
+                self._http.setdefault(event["key"], deque()).append(
+                    RecordedResponse(event["status"], event["text"], event["elapsed"])
+                )
+            elif event["t"] == "ws":
+                connections.setdefault(event["conn"], []).append(event)
+        self._connections = deque(connections[conn] for conn in sorted(connections))
+        _log.debug(
+            f"Loaded cassette with {len(events)} events, "
+            f"{len(self._connections)} websocket connections"
+        )
+
+    def save(self):
+        with gzip.open(self.path, "wt", encoding="utf8") as f:
+            for event in self._events:
+                f.write(json.dumps(event, separators=(",", ":")))
+                f.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.mode == "record":
+            self.save()
+        return False
+
+    def play(self, method: str, link: str, data=None):
+        responses = self._http.get(_key(method, link, data))
+        if not responses:
+            raise errors.CassetteError(f"No recorded response for {method} {link}")
+        response = responses.popleft() if len(responses) > 1 else responses[0]
+        return response
+
+    def record(self, method: str, link: str, data, response, elapsed: float):
+        self._events.append(
+            {
+                "t": "http",
+                "key": _key(method, link, data),
+                "status": response.status_code,
+                "text": response.text,
+                "elapsed": elapsed,
+            }
+        )
+
+    def websocket(self, ws=None):
+        """Wrap a live websocket, or return the next recorded one"""
+        if self.replaying:
+            if not self._connections:
+                raise errors.CassetteError("No recorded websocket connection left")
+            return ReplayWebSocket(self._connections.popleft(), self.speed)
+
+        conn = next(self._conn_ids)
+        self._opened[conn] = time.monotonic()
+        return RecordingWebSocket(ws, self, conn)
+
+    def _frame(self, conn: int, direction: str, message):
+        if isinstance(message, bytes):
+            message = message.decode("utf8")
+        self._events.append(
+            {
+                "t": "ws",
+                "conn": conn,
+                "dir": direction,
+                "at": time.monotonic() - self._opened[conn],
+                "data": message,
+            }
+        )
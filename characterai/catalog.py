@@ -0,0 +1,368 @@
+from bisect import bisect_left
+import heapq
+import re
+import time
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["CharacterCatalog"]
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokens(text: str):
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def _deletes(token: str):
+    """All variants of token with one character removed"""
+    return {token[:i] + token[i + 1 :] for i in range(len(token))}
+
+
+def _character_name(char: dict):
+    return (
+        char.get("name")
+        or char.get("participant__name")
+        or (char.get("participant") or {}).get("name")
+        or ""
+    )
+
+
+def _fingerprint(char: dict):
+    return (
+        _character_name(char),
+        char.get("title") or "",
+        char.get("description") or "",
+        frozenset(_character_categories(char)),
+    )
+
+
+def _character_categories(char: dict):
+    names = set()
+    for category in char.get("categories") or ():
+        if isinstance(category, dict):
+            category = category.get("name") or category.get("description")
+        if category:
+            names.add(str(category).lower())
+    return names
+
+
+class CharacterCatalog:
+    """Local in-memory index of characters
+
+    catalog = CharacterCatalog(client)
+    catalog.refresh()
+    catalog.search('QUERY', category='CATEGORY')
+    catalog.lookup('QUERY')
+    await catalog.arefresh()
+    await catalog.alookup('QUERY')
+
+    Characters are collected from trending, recommended, categories,
+    info and search responses. Lookups are answered from an inverted
+    index over name, title and description with prefix matching and
+    one-edit fuzzy matching for terms that have no direct hit;
+    `lookup` falls back to the remote search on a miss.
+
+    """
+
+    def __init__(self, client=None, *, fuzzy: bool = True, max_age: float = None):
+        self.client = client
+        self.fuzzy = fuzzy
+        self.max_age = max_age
+
+        self.characters = {}
+        self.categories = {}
+        self.refreshed = None
+
+        self._fingerprints = {}
+        self._doc_tokens = {}
+        self._doc_categories = {}
+        self._postings = {}
+        self._by_category = {}
+        self._sorted = []
+        self._sorted_dirty = False
+        self._deletes = {}
+
+    def __len__(self):
+        return len(self.characters)
+
+    def __contains__(self, external_id: str):
+        return external_id in self.characters
+
+    def get(self, external_id: str):
+        return self.characters.get(external_id)
+
+    @property
+    def stale(self):
+        if self.refreshed is None:
+            return True
+        if self.max_age is None:
+            return False
+        return time.monotonic() - self.refreshed > self.max_age
+
+    def add(self, char: dict):
+        """Insert or update one character, returns True if it changed"""
+        external_id = char.get("external_id")
+        if not external_id:
+            return False
+
+        if self._fingerprints.get(external_id) == _fingerprint(char):
+            self.characters[external_id].update(char)
+            return False
+
+        if external_id in self.characters:
+            merged = {**self.characters[external_id], **char}
+            self._unindex(external_id)
+        else:
+            merged = dict(char)
+
+        self.characters[external_id] = merged
+        self._index(external_id, merged)
+        return True
+
+    def remove(self, external_id: str):
+        if external_id in self.characters:
+            self._unindex(external_id)
+            del self.characters[external_id]
+
+    def ingest(self, response):
+        """Add every character found in an API response, returns the number changed"""
+        if isinstance(response, list):
+            return sum(self.ingest(item) for item in response)
+        if not isinstance(response, dict):
+            return 0
+
+        changed = 0
+        if "external_id" in response and (
+            "title" in response or "name" in response or "participant__name" in response
+        ):
+            changed += self.add(response)
+
+        if isinstance(response.get("character"), dict):
+            changed += self.add(response["character"])
+
+        for key in (
+            "characters",
+            "trending_characters",
+            "recommended_characters",
+        ):
+            for char in response.get(key) or ():
+                if isinstance(char, dict):
+                    changed += self.add(char)
+
+        for category in response.get("categories") or ():
+            if isinstance(category, dict) and category.get("name"):
+                self.categories[category["name"].lower()] = category
+
+        curated = response.get("characters_by_curated_category")
+        if isinstance(curated, dict):
+            for name, chars in curated.items():
+                for char in chars or ():
+                    if isinstance(char, dict):
+                        if "categories" not in char:
+                            # the response may be cached or shared, copy it
+                            char = {**char, "categories": [name]}
+                        changed += self.add(char)
+
+        return changed
+
+    def search(
+        self,
+        query: str,
+        *,
+        category: str = None,
+        limit: int = 20,
+        prefix: bool = True,
+        fuzzy: bool = None,
+    ):
+        if fuzzy is None:
+            fuzzy = self.fuzzy
+
+        terms = _tokens(query)
+        if category is not None:
+            allowed = self._by_category.get(category.lower(), set())
+            if not terms:
+                return [self.characters[i] for i in list(allowed)[:limit]]
+        else:
+            allowed = None
+
+        if not terms:
+            return []
+
+        # Resolve every query term to the index tokens it matches, then
+        # walk the postings of the rarest term only and score the other
+        # terms against each candidate's own (small) token set.
+        matches = []
+        for n, term in enumerate(terms):
+            tokens = {}
+            if term in self._postings:
+                tokens[term] = 3.0
+            if prefix and n == len(terms) - 1:
+                for token in self._prefixed(term):
+                    tokens[token] = 2.0
+            if fuzzy and not tokens and len(term) > 3:
+                for token in self._fuzzy(term):
+                    tokens[token] = 1.0
+            if not tokens:
+                return []
+            matches.append(tokens)
+
+        matches.sort(key=lambda tokens: sum(len(self._postings[t]) for t in tokens))
+        rarest, rest = matches[0], matches[1:]
+
+        scores = {}
+        for token, score in rarest.items():
+            for doc in self._postings[token]:
+                if scores.get(doc, 0) < score:
+                    scores[doc] = score
+
+        for tokens in rest:
+            narrowed = {}
+            for doc, score in scores.items():
+                best = max((tokens.get(t, 0) for t in self._doc_tokens[doc]), default=0)
+                if best:
+                    narrowed[doc] = score + best
+            scores = narrowed
+            if not scores:
+                return []
+
+        if allowed is not None:
+            scores = {doc: s for doc, s in scores.items() if doc in allowed}
+
+        ranked = heapq.nsmallest(
+            limit,
+            scores,
+            key=lambda doc: (
+                -scores[doc],
+                -(self.characters[doc].get("participant__num_interactions") or 0),
+            ),
+        )
+        return [self.characters[doc] for doc in ranked]
+
+    def refresh(self, *, token: str = None):
+        """Re-fetch the discovery endpoints with a PyCAI client"""
+        character = self.client.character
+        changed = self.ingest(character.trending())
+        changed += self.ingest(character.recommended(token=token))
+        changed += self.ingest(character.categories())
+        self.refreshed = time.monotonic()
+        _log.debug(f"Catalog refreshed, {changed} characters changed")
+        return changed
+
+    async def arefresh(self, *, token: str = None):
+        """Re-fetch the discovery endpoints with a PyAsyncCAI client"""
+        character = self.client.character
+        changed = self.ingest(await character.trending())
+        changed += self.ingest(await character.recommended(token=token))
+        changed += self.ingest(await character.categories())
+        self.refreshed = time.monotonic()
+        _log.debug(f"Catalog refreshed, {changed} characters changed")
+        return changed
+
+    def lookup(
+        self, query: str, *, category: str = None, limit: int = 20, token: str = None
+    ):
+        """Search locally, falling back to `character.search` on a miss"""
+        if self.stale and self.client is not None and self.max_age is not None:
+            self.refresh(token=token)
+        found = self.search(query, category=category, limit=limit)
+        # a query without terms has nothing to search remotely either
+        if found or self.client is None or not _tokens(query):
+            return found
+        _log.debug(f"Catalog miss for query: {query}")
+        self.ingest(self.client.character.search(query, token=token))
+        return self.search(query, category=category, limit=limit)
+
+    async def alookup(
+        self, query: str, *, category: str = None, limit: int = 20, token: str = None
+    ):
+        if self.stale and self.client is not None and self.max_age is not None:
+            await self.arefresh(token=token)
+        found = self.search(query, category=category, limit=limit)
+        if found or self.client is None or not _tokens(query):
+            return found
+        _log.debug(f"Catalog miss for query: {query}")
+        self.ingest(await self.client.character.search(query, token=token))
+        return self.search(query, category=category, limit=limit)
+
+    def info(self, char: str, *, token: str = None):
+        """`character.info` that also feeds the catalog"""
+        response = self.client.character.info(char, token=token)
+        self.ingest(response)
+        return response
+
+    async def ainfo(self, char: str, *, token: str = None):
+        response = await self.client.character.info(char, token=token)
+        self.ingest(response)
+        return response
+
+    def _index(self, external_id: str, char: dict):
+        self._fingerprints[external_id] = _fingerprint(char)
+
+        tokens = set()
+        for text in (_character_name(char), char.get("title"), char.get("description")):
+            tokens.update(_tokens(text))
+        self._doc_tokens[external_id] = tokens
+
+        for token in tokens:
+            docs = self._postings.get(token)
+            if docs is None:
+                docs = self._postings[token] = set()
+                self._sorted_dirty = True
+                for variant in _deletes(token):
+                    self._deletes.setdefault(variant, set()).add(token)
+            docs.add(external_id)
+
+        categories = _character_categories(char)
+        self._doc_categories[external_id] = categories
+        for category in categories:
+            self._by_category.setdefault(category, set()).add(external_id)
+
+    def _unindex(self, external_id: str):
+        for token in self._doc_tokens.pop(external_id, ()):
+            docs = self._postings.get(token)
+            if docs is None:
+                continue
+            docs.discard(external_id)
+            if not docs:
+                del self._postings[token]
+                self._sorted_dirty = True
+                for variant in _deletes(token):
+                    owners = self._deletes.get(variant)
+                    if owners is not None:
+                        owners.discard(token)
+                        if not owners:
+                            del self._deletes[variant]
+
+        for category in self._doc_categories.pop(external_id, ()):
+            docs = self._by_category.get(category)
+            if docs is not None:
+                docs.discard(external_id)
+                if not docs:
+                    del self._by_category[category]
+
+        self._fingerprints.pop(external_id, None)
+
+    def _prefixed(self, term: str):
+        if self._sorted_dirty:
+            self._sorted = sorted(self._postings)
+            self._sorted_dirty = False
+        start = bisect_left(self._sorted, term)
+        for token in self._sorted[start:]:
+            if not token.startswith(term):
+                break
+            if token != term:
+                yield token
+
+    def _fuzzy(self, term: str):
+        """Tokens within one insert, delete or substitution of term"""
+        found = set()
+        found.update(self._deletes.get(term, ()))
+        for variant in _deletes(term):
+            if variant in self._postings:
+                found.add(variant)
+            found.update(self._deletes.get(variant, ()))
+        found.discard(term)
+        return [token for token in found if token in self._postings]
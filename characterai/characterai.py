@@ -1,8 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 import tls_client
-import json
-
-from characterai import errors
+import asyncio
+import threading
+import time
+
+from characterai import errors, protocol
+from characterai.bridge import LoopThread
+from characterai.cassette import Cassette
+from characterai.diskcache import DiskCache
+from characterai.health import HealthProber
+from characterai.profiling import Profiler
+from characterai.traffic import Traffic
 from characterai.pyasynccai import PyAsyncCAI
 
 import logging
@@ -13,19 +22,44 @@ __all__ = ["PyCAI", "PyAsyncCAI"]
 
 
 class PyCAI:
-    def __init__(self, token: str = None, plus: bool = False):
+    def __init__(
+        self,
+        token: str = None,
+        plus: bool = False,
+        *,
+        cassette: Cassette = None,
+        cache: DiskCache = None,
+        health: HealthProber = None,
+        profiler: Profiler = None,
+        http2: bool = True,
+        traffic: Traffic = None,
+        accept_encoding: str = "gzip, deflate, br",
+    ):
         self.token = token
+        self._keepalive = None
+        self._idle = None
 
         sub = "plus" if plus else "old"
-        self.session = tls_client.Session(client_identifier="chrome112")
+        # chrome112 offers h2 in ALPN, so threads sharing this client
+        # share one multiplexed connection per host
+        self.session = tls_client.Session(
+            client_identifier="chrome112", force_http1=not http2
+        )
 
-        setattr(self.session, "url", f"https://{sub}.character.ai/")
+        setattr(self.session, "url", protocol.web_url(sub))
         setattr(self.session, "token", token)
+        setattr(self.session, "cassette", cassette)
+        setattr(self.session, "cache", cache)
+        setattr(self.session, "health", health)
+        setattr(self.session, "profiler", profiler)
+        setattr(self.session, "traffic", traffic)
+        setattr(self.session, "accept_encoding", accept_encoding)
 
         self.user = self.user(token, self.session)
         self.post = self.post(token, self.session)
         self.character = self.character(token, self.session)
         self.chat = self.chat(token, self.session)
+        self.chat2 = self.chat2(token, self.session)
 
     def request(
         self,
@@ -36,40 +70,191 @@ class PyCAI:
         data: dict = None,
         split: bool = False,
         neo: bool = False,
+        fields: list = None,
+        cached: bool = False,
+    ):
+        return PyCAI.send(
+            protocol.Request(
+                self, method=method, data=data, split=split, neo=neo, cached=cached
+            ),
+            session,
+            token=token,
+            fields=fields,
+        )
+
+    def send(
+        request: protocol.Request,
+        session: tls_client.Session,
+        *,
+        token: str = None,
+        fields: list = None,
+        use_cache: bool = True,
     ):
+        """Perform a request described by characterai.protocol"""
         _log.debug(
-            f"Request method: {method}, data: {data}, split: {split}, neo: {neo}"
+            f"Request method: {request.method}, data: {request.data}, "
+            f"split: {request.split}, neo: {request.neo}"
         )
-        link = f"https://neo.character.ai/{self}" if neo else f"{session.url}{self}"
+        link = protocol.link(request, session.url)
         key = session.token if token is None else token
-        headers = {"Authorization": f"Token {key}"}
-
-        if method == "GET":
-            response = session.get(link, headers=headers)
-
-        elif method == "POST":
-            response = session.post(link, headers=headers, json=data)
-
-        elif method == "PUT":
-            response = session.put(link, headers=headers, json=data)
-
-        data = json.loads(response.text.split("\n")[-2]) if split else response.json()
-        _log.debug(f"Response code: {response.status_code}")
-        _log.debug(f"Response data: {data}")
-        if str(data).startswith("{'command': 'neo_error'"):
-            raise errors.ServerError(data["comment"])
-        elif str(data).startswith("{'detail': 'Auth"):
-            raise errors.AuthError("Invalid token")
-        elif str(data).startswith("{'status': 'Error"):
-            raise errors.ServerError(data["status"])
-        elif str(data).startswith("{'error'"):
-            raise errors.ServerError(data["error"])
-        else:
+        headers = protocol.headers(key, getattr(session, "accept_encoding", None))
+
+        cache = getattr(session, "cache", None)
+        if use_cache and request.cached and cache is not None and fields is None:
+            return cache.fetch(
+                cache.key(request.method, link, request.data, key),
+                lambda: PyCAI.send(request, session, token=token, use_cache=False),
+            )
+
+        cassette = getattr(session, "cassette", None)
+        start = time.monotonic()
+
+        profiler = getattr(session, "profiler", None)
+        span = profiler.span(request.path) if profiler is not None else None
+
+        # cache and cassette keys keep the configured host, only the
+        # request itself goes to the host the prober picked
+        health = getattr(session, "health", None)
+        host = None
+        target = link
+        if health is not None and not request.neo:
+            if cassette is None or not cassette.replaying:
+                host = health.best()
+                target = f"{host}{request.path}"
+
+        method, data = request.method, request.data
+        response = None
+        try:
+            if cassette is not None and cassette.replaying:
+                response = cassette.play(method, link, data)
+                if cassette.speed:
+                    time.sleep(response.elapsed / cassette.speed)
+
+            elif method == "GET":
+                response = session.get(target, headers=headers)
+
+            elif method == "POST":
+                response = session.post(target, headers=headers, json=data)
+
+            elif method == "PUT":
+                response = session.put(target, headers=headers, json=data)
+        finally:
+            if host is not None:
+                health.observe(host, time.monotonic() - start, response)
+            if span is not None:
+                span.mark("send")
+                if response is None:
+                    span.end(failed=True)
+
+        if cassette is not None and not cassette.replaying:
+            cassette.record(method, link, data, response, time.monotonic() - start)
+        traffic = getattr(session, "traffic", None)
+        if traffic is not None and (cassette is None or not cassette.replaying):
+            traffic.observe(request.path, data, response)
+
+        failed = True
+        try:
+            data, projected = protocol.decode(request, response.text, fields)
+            if span is not None:
+                span.mark("decode")
+            if not projected:
+                _log.debug(f"Response code: {response.status_code}")
+                _log.debug(f"Response data: {data}")
+                if span is not None:
+                    span.mark("log")
+                protocol.check(data)
+            failed = False
             return data
+        finally:
+            if span is not None:
+                span.mark("classify")
+                span.end(failed=failed)
 
     def ping(self):
         _log.debug("Pinging server")
-        return self.session.get("https://neo.character.ai/ping/").json()
+        return self.session.get(protocol.PING_URL).json()
+
+    def warmup(
+        self, *, token: str = None, websocket: bool = True, interval: float = 30
+    ):
+        """Open connections before the first call needs them
+
+        Same as PyAsyncCAI.warmup: hosts are touched in parallel with
+        validating the token and opening the chat2 websocket of the
+        blocking bridge, and pinged every `interval` seconds from a
+        daemon thread until cooldown().
+        """
+        _log.debug("Warming up connections")
+        hosts = self._hosts()
+        cassette = getattr(self.session, "cassette", None)
+        if cassette is not None and cassette.replaying:
+            hosts = []
+
+        with ThreadPoolExecutor(len(hosts) + 2) as pool:
+            touches = [pool.submit(self._touch, host) for host in hosts]
+            validate = pool.submit(
+                PyCAI.send,
+                protocol.user_info(),
+                self.session,
+                token=token,
+                use_cache=False,
+            )
+            ws = pool.submit(self.chat2.warmup) if websocket else None
+
+            results = {}
+            for host, touch in zip(hosts, touches):
+                try:
+                    results[host] = touch.result()
+                except Exception as e:
+                    results[host] = e
+            validate.result()
+            if ws is not None:
+                ws.result()
+
+        if interval and self._keepalive is None:
+            self._idle = threading.Event()
+            self._keepalive = threading.Thread(
+                target=self._ping_hosts,
+                args=(interval, self._idle),
+                name="characterai-keepalive",
+                daemon=True,
+            )
+            self._keepalive.start()
+        return results
+
+    def cooldown(self):
+        """Stop the idle pings"""
+        if self._keepalive is not None:
+            self._idle.set()
+            self._keepalive.join()
+            self._keepalive = None
+
+    def _hosts(self):
+        hosts = [self.session.url]
+        health = getattr(self.session, "health", None)
+        if health is not None:
+            hosts += [host for host in health.hosts if host not in hosts]
+        return hosts + [protocol.NEO_URL]
+
+    def _touch(self, host: str):
+        """Seconds a ping to host took, over a connection kept for later"""
+        start = time.monotonic()
+        response = self.session.get(f"{host}ping/")
+        latency = time.monotonic() - start
+        health = getattr(self.session, "health", None)
+        if health is not None:
+            health.observe(host, latency, response)
+        if response.status_code >= 500:
+            raise errors.ServerError(f"HTTP {response.status_code} from {host}")
+        return latency
+
+    def _ping_hosts(self, interval: float, idle: threading.Event):
+        while not idle.wait(interval):
+            for host in self._hosts():
+                try:
+                    self._touch(host)
+                except Exception as e:
+                    _log.debug(f"Idle ping to {host} failed: {e!r}")
 
     class user:
         """Responses from site for user info
@@ -86,46 +271,38 @@ class PyCAI:
             self.token = token
             self.session = session
 
-        def info(self, *, token: str = None):
+        def info(self, *, token: str = None, fields: list = None):
             _log.debug("Getting user info")
-            return PyCAI.request("chat/user/", self.session, token=token)
+            return PyCAI.send(
+                protocol.user_info(), self.session, token=token, fields=fields
+            )
 
         def get_profile(self, username: str, *, token: str = None):
             _log.debug(f"Getting profile for username: {username}")
-            return PyCAI.request(
-                "chat/user/public/",
-                self.session,
-                token=token,
-                method="POST",
-                data={"username": username},
+            return PyCAI.send(
+                protocol.user_profile(username), self.session, token=token
             )
 
         def followers(self, *, token: str = None):
             _log.debug("Getting followers")
-            return PyCAI.request("chat/user/followers/", self.session, token=token)
+            return PyCAI.send(protocol.user_followers(), self.session, token=token)
 
         def following(self, *, token: str = None):
             _log.debug("Getting following")
-            return PyCAI.request("chat/user/following/", self.session, token=token)
+            return PyCAI.send(protocol.user_following(), self.session, token=token)
 
         def recent(self, *, token: str = None):
             _log.debug("Getting recent characters")
-            return PyCAI.request("chat/characters/recent/", self.session, token=token)
+            return PyCAI.send(protocol.user_recent(), self.session, token=token)
 
         def characters(self, *, token: str = None):
             _log.debug("Getting characters")
-            return PyCAI.request(
-                "chat/characters/?scope=user", self.session, token=token
-            )
+            return PyCAI.send(protocol.user_characters(), self.session, token=token)
 
         def update(self, username: str, *, token: str = None, **kwargs):
             _log.debug(f"Updating user with username: {username}, data: {kwargs}")
-            return PyCAI.request(
-                "chat/user/update/",
-                self.session,
-                token=token,
-                method="POST",
-                data={"username": username, **kwargs},
+            return PyCAI.send(
+                protocol.user_update(username, **kwargs), self.session, token=token
             )
 
     class post:
@@ -148,18 +325,25 @@ class PyCAI:
             self.session = session
             _log.debug("Post object initialized")
 
-        def get_post(self, post_id: str):
+        def get_post(self, post_id: str, *, fields: list = None):
             _log.debug(f"Getting post with ID: {post_id}")
-            return PyCAI.request(f"chat/post/?post={post_id}", self.session)
+            return PyCAI.send(protocol.post_get(post_id), self.session, fields=fields)
 
-        def my(self, *, posts_page: int = 1, posts_to_load: int = 5, token: str = None):
+        def my(
+            self,
+            *,
+            posts_page: int = 1,
+            posts_to_load: int = 5,
+            token: str = None,
+            fields: list = None,
+        ):
             _log.debug(
                 f"Getting my posts, page: {posts_page}, posts to load: {posts_to_load}"
             )
-            return PyCAI.request(
-                f"chat/posts/user/?scope=user&page={posts_page}"
-                f"&posts_to_load={posts_to_load}/",
+            return PyCAI.send(
+                protocol.post_my(posts_page, posts_to_load),
                 self.session,
+                fields=fields,
             )
 
         def get_posts(
@@ -168,34 +352,27 @@ class PyCAI:
             *,
             posts_page: int = 1,
             posts_to_load: int = 5,
+            fields: list = None,
         ):
             _log.debug(
                 f"Getting posts for username: {username}, page: {posts_page}, posts to load: {posts_to_load}"
             )
-            return PyCAI.request(
-                f"chat/posts/user/?username={username}"
-                f"&page={posts_page}&posts_to_load={posts_to_load}/",
+            return PyCAI.send(
+                protocol.post_list(username, posts_page, posts_to_load),
                 self.session,
+                fields=fields,
             )
 
         def upvote(self, post_external_id: str, *, token: str = None):
             _log.debug(f"Upvoting post with external ID: {post_external_id}")
-            return PyCAI.request(
-                "chat/post/upvote/",
-                self.session,
-                token=token,
-                method="POST",
-                data={"post_external_id": post_external_id},
+            return PyCAI.send(
+                protocol.post_upvote(post_external_id), self.session, token=token
             )
 
         def undo_upvote(self, post_external_id: str, *, token: str = None):
             _log.debug(f"Undoing upvote for post with external ID: {post_external_id}")
-            return PyCAI.request(
-                "chat/post/undo-upvote/",
-                self.session,
-                token=token,
-                method="POST",
-                data={"post_external_id": post_external_id},
+            return PyCAI.send(
+                protocol.post_undo_upvote(post_external_id), self.session, token=token
             )
 
         def send_comment(
@@ -204,28 +381,20 @@ class PyCAI:
             _log.debug(
                 f"Sending comment to post with ID: {post_id}, text: {text}, parent UUID: {parent_uuid}"
             )
-            return PyCAI.request(
-                "chat/comment/create/",
+            return PyCAI.send(
+                protocol.post_comment(post_id, text, parent_uuid),
                 self.session,
                 token=token,
-                method="POST",
-                data={
-                    "post_external_id": post_id,
-                    "text": text,
-                    "parent_uuid": parent_uuid,
-                },
             )
 
         def delete_comment(self, message_id: int, post_id: str, *, token: str = None):
             _log.debug(
                 f"Deleting comment with message ID: {message_id} from post with ID: {post_id}"
             )
-            return PyCAI.request(
-                "chat/comment/delete/",
+            return PyCAI.send(
+                protocol.post_delete_comment(message_id, post_id),
                 self.session,
                 token=token,
-                method="POST",
-                data={"external_id": message_id, "post_external_id": post_id},
             )
 
         def create(
@@ -241,40 +410,21 @@ class PyCAI:
             _log.debug(
                 f"Creating post with type: {post_type}, external ID: {external_id}, title: {title}, text: {text}, visibility: {post_visibility}, additional data: {kwargs}"
             )
-            if post_type == "POST":
-                post_link = "chat/post/create/"
-                data = {
-                    "post_title": title,
-                    "topic_external_id": external_id,
-                    "post_text": text,
-                    **kwargs,
-                }
-            elif post_type == "CHAT":
-                post_link = "chat/chat-post/create/"
-                data = {
-                    "post_title": title,
-                    "subject_external_id": external_id,
-                    "post_visibility": post_visibility,
-                    **kwargs,
-                }
-            else:
-                raise errors.PostTypeError("Invalid post_type")
-
-            return PyCAI.request(post_link, self.session, token=token, method="POST")
-
-        def delete(self, post_id: str, *, token: str = None):
-            _log.debug(f"Deleting post with ID: {post_id}")
-            return PyCAI.request(
-                "chat/post/delete/",
+            return PyCAI.send(
+                protocol.post_create(
+                    post_type, external_id, title, text, post_visibility, **kwargs
+                ),
                 self.session,
                 token=token,
-                method="POST",
-                data={"external_id": post_id},
             )
 
+        def delete(self, post_id: str, *, token: str = None):
+            _log.debug(f"Deleting post with ID: {post_id}")
+            return PyCAI.send(protocol.post_delete(post_id), self.session, token=token)
+
         def get_topics(self):
             _log.debug("Getting topics")
-            return PyCAI.request("chat/topics/", self.session)
+            return PyCAI.send(protocol.post_topics(), self.session)
 
         def feed(
             self,
@@ -284,15 +434,16 @@ class PyCAI:
             sort: str = "top",
             *,
             token: str = None,
+            fields: list = None,
         ):
             _log.debug(
                 f"Getting feed for topic: {topic}, page: {num}, posts to load: {load}, sort: {sort}"
             )
-            return PyCAI.request(
-                f"chat/posts/?topic={topic}&page={num}"
-                f"&posts_to_load={load}&sort={sort}",
+            return PyCAI.send(
+                protocol.post_feed(topic, num, load, sort),
                 self.session,
                 token=token,
+                fields=fields,
             )
 
     class character:
@@ -331,31 +482,27 @@ class PyCAI:
             token: str = None,
             **kwargs,
         ):
-            if categories is None:
-                categories = []
             _log.debug(
                 f"Creating character with greeting: {greeting}, identifier: {identifier}, name: {name}, additional data: {kwargs}"
             )
-            return PyCAI.request(
-                "../chat/character/create/",
+            return PyCAI.send(
+                protocol.character_create(
+                    greeting,
+                    identifier,
+                    name,
+                    avatar_rel_path=avatar_rel_path,
+                    base_img_prompt=base_img_prompt,
+                    categories=categories,
+                    copyable=copyable,
+                    definition=definition,
+                    description=description,
+                    title=title,
+                    img_gen_enabled=img_gen_enabled,
+                    visibility=visibility,
+                    **kwargs,
+                ),
                 self.session,
                 token=token,
-                method="POST",
-                data={
-                    "greeting": greeting,
-                    "identifier": identifier,
-                    "name": name,
-                    "avatar_rel_path": avatar_rel_path,
-                    "base_img_prompt": base_img_prompt,
-                    "categories": categories,
-                    "copyable": copyable,
-                    "definition": definition,
-                    "description": description,
-                    "img_gen_enabled": img_gen_enabled,
-                    "title": title,
-                    "visibility": visibility,
-                    **kwargs,
-                },
             )
 
         def update(
@@ -374,68 +521,73 @@ class PyCAI:
             token: str = None,
             **kwargs,
         ):
-            if categories is None:
-                categories = []
             _log.debug(
                 f"Updating character with external ID: {external_id}, greeting: {greeting}, identifier: {identifier}, name: {name}, additional data: {kwargs}"
             )
-            return PyCAI.request(
-                "../chat/character/update/",
+            return PyCAI.send(
+                protocol.character_update(
+                    external_id,
+                    greeting,
+                    identifier,
+                    name,
+                    title,
+                    categories,
+                    definition,
+                    copyable,
+                    description,
+                    visibility,
+                    **kwargs,
+                ),
                 self.session,
                 token=token,
-                method="POST",
-                data={
-                    "external_id": external_id,
-                    "name": name,
-                    "categories": categories,
-                    "title": title,
-                    "visibility": visibility,
-                    "copyable": copyable,
-                    "description": description,
-                    "greeting": greeting,
-                    "definition": definition,
-                    **kwargs,
-                },
             )
 
-        def trending(self):
+        def trending(self, *, fields: list = None):
             _log.debug("Fetching trending characters")
-            return PyCAI.request("chat/characters/trending/", self.session)
+            return PyCAI.send(
+                protocol.character_trending(), self.session, fields=fields
+            )
 
-        def recommended(self, *, token: str = None):
+        def recommended(self, *, token: str = None, fields: list = None):
             _log.debug("Fetching recommended characters")
-            return PyCAI.request(
-                "chat/characters/recommended/", self.session, token=token
+            return PyCAI.send(
+                protocol.character_recommended(),
+                self.session,
+                token=token,
+                fields=fields,
             )
 
         def categories(self):
             _log.debug("Fetching character categories")
-            return PyCAI.request("chat/character/categories/", self.session)
+            return PyCAI.send(protocol.character_categories(), self.session)
 
         def info(
             self,
             char: str,
             *,
             token: str = None,
+            fields: list = None,
         ):
             _log.debug(f"Fetching info for character: {char}")
-            return PyCAI.request(
-                "chat/character/",
+            return PyCAI.send(
+                protocol.character_info(char),
                 self.session,
                 token=token,
-                method="POST",
-                data={"external_id": char},
+                fields=fields,
             )
 
-        def search(self, query: str, *, token: str = None):
+        def search(self, query: str, *, token: str = None, fields: list = None):
             _log.debug(f"Searching characters with query: {query}")
-            return PyCAI.request(
-                f"chat/characters/search/?query={query}/", self.session, token=token
+            return PyCAI.send(
+                protocol.character_search(query),
+                self.session,
+                token=token,
+                fields=fields,
             )
 
         def voices(self):
             _log.debug("Fetching character voices")
-            return PyCAI.request("chat/character/voices/", self.session)
+            return PyCAI.send(protocol.character_voices(), self.session)
 
     class chat:
         """Managing a chat with a character
@@ -468,18 +620,10 @@ class PyCAI:
             _log.debug(
                 f"Creating room with characters: {characters}, name: {name}, topic: {topic}, additional data: {kwargs}"
             )
-            return PyCAI.request(
-                "../chat/room/create/",
+            return PyCAI.send(
+                protocol.chat_create_room(characters, name, topic, **kwargs),
                 self.session,
                 token=token,
-                method="POST",
-                data={
-                    "characters": characters,
-                    "name": name,
-                    "topic": topic,
-                    "visibility": "PRIVATE",
-                    **kwargs,
-                },
             )
 
         def rate(
@@ -494,28 +638,10 @@ class PyCAI:
             _log.debug(
                 f"Rating with rate: {rate}, history ID: {history_id}, message ID: {message_id}, additional data: {kwargs}"
             )
-            if rate == 0:
-                label = [234, 238, 241, 244]  # Terrible
-            elif rate == 1:
-                label = [235, 237, 241, 244]  # Bad
-            elif rate == 2:
-                label = [235, 238, 240, 244]  # Good
-            elif rate == 3:
-                label = [235, 238, 241, 243]  # Fantastic
-            else:
-                raise errors.LabelError("Wrong Rate Value")
-
-            return PyCAI.request(
-                "chat/annotations/label/",
+            return PyCAI.send(
+                protocol.chat_rate(rate, history_id, message_id, **kwargs),
                 self.session,
                 token=token,
-                method="PUT",
-                data={
-                    "label_ids": label,
-                    "history_external_id": history_id,
-                    "message_uuid": message_id,
-                    **kwargs,
-                },
             )
 
         def next_message(
@@ -525,71 +651,70 @@ class PyCAI:
             tgt: str,
             *,
             token: str = None,
+            fields: list = None,
             **kwargs,
         ):
             _log.debug(
                 f"Getting next message with history ID: {history_id}, parent message UUID: {parent_msg_uuid}, tgt: {tgt}, additional data: {kwargs}"
             )
-            response = PyCAI.request(
-                "chat/streaming/",
+            return PyCAI.send(
+                protocol.chat_next_message(history_id, parent_msg_uuid, tgt, **kwargs),
                 self.session,
                 token=token,
-                method="POST",
-                split=True,
-                data={
-                    "history_external_id": history_id,
-                    "parent_msg_uuid": parent_msg_uuid,
-                    "tgt": tgt,
-                    **kwargs,
-                },
+                fields=fields,
             )
 
-        def get_histories(self, char: str, *, number: int = 50, token: str = None):
+        def get_histories(
+            self, char: str, *, number: int = 50, token: str = None, fields: list = None
+        ):
             _log.debug(f"Getting histories for character: {char}, number: {number}")
-            return PyCAI.request(
-                "chat/character/histories_v2/",
+            return PyCAI.send(
+                protocol.chat_histories(char, number),
                 self.session,
                 token=token,
-                method="POST",
-                data={"external_id": char, "number": number},
+                fields=fields,
             )
 
-        def get_history(self, history_id: str = None, *, token: str = None):
+        def get_history(
+            self, history_id: str = None, *, token: str = None, fields: list = None
+        ):
             _log.debug(f"Getting history with ID: {history_id}")
-            return PyCAI.request(
-                "chat/history/msgs/user/?" f"history_external_id={history_id}",
+            return PyCAI.send(
+                protocol.chat_history(history_id),
                 self.session,
                 token=token,
+                fields=fields,
             )
 
-        def get_chat(self, char: str = None, *, token: str = None, **kwargs):
+        def get_chat(
+            self, char: str = None, *, token: str = None, fields: list = None, **kwargs
+        ):
             _log.debug(f"Getting chat for character: {char}, additional data: {kwargs}")
-            return PyCAI.request(
-                "chat/history/continue/",
+            return PyCAI.send(
+                protocol.chat_continue(char, **kwargs),
                 self.session,
                 token=token,
-                method="POST",
-                data={"character_external_id": char, **kwargs},
+                fields=fields,
             )
 
         def send_message(
-            self, history_id: str, tgt: str, text: str, *, token: str = None, **kwargs
+            self,
+            history_id: str,
+            tgt: str,
+            text: str,
+            *,
+            token: str = None,
+            fields: list = None,
+            **kwargs,
         ):
             _log.debug(
                 f"Sending message with history ID: {history_id}, tgt: {tgt}, text: {text}, additional data: {kwargs}"
             )
-            return PyCAI.request(
-                "chat/streaming/",
+            return PyCAI.send(
+                protocol.chat_send_message(history_id, tgt, text, **kwargs),
                 self.session,
                 token=token,
-                method="POST",
-                split=True,
-                data={
-                    "history_external_id": history_id,
-                    "tgt": tgt,
-                    "text": text,
-                    **kwargs,
-                },
+                fields=fields,
             )
 
         def delete_message(
@@ -598,24 +723,137 @@ class PyCAI:
             _log.debug(
                 f"Deleting message with history ID: {history_id}, UUIDs to delete: {uuids_to_delete}, additional data: {kwargs}"
             )
-            return PyCAI.request(
-                "chat/history/msgs/delete/",
+            return PyCAI.send(
+                protocol.chat_delete_message(history_id, uuids_to_delete, **kwargs),
                 self.session,
                 token=token,
-                method="POST",
-                data={
-                    "history_id": history_id,
-                    "uuids_to_delete": uuids_to_delete,
-                    **kwargs,
-                },
             )
 
         def new_chat(self, char: str, *, token: str = None):
             _log.debug(f"Creating new chat for character: {char}")
-            return PyCAI.request(
-                "chat/history/create/",
-                self.session,
-                token=token,
-                method="POST",
-                data={"character_external_id": char},
+            return PyCAI.send(protocol.chat_new(char), self.session, token=token)
+
+    class chat2:
+        """Blocking access to the chat2 websocket
+
+        chat2.send_message('CHAR', 'CHAT_ID', 'TEXT', {AUTHOR})
+        chat2.next_message('CHAR', 'CHAT_ID', 'PARENT_ID')
+        for delta in chat2.stream_message('CHAR', 'CHAT_ID', 'TEXT', {AUTHOR}):
+            print(delta.text, end='')
+        chat2.new_chat('CHAR', 'CHAT_ID', 'CREATOR_ID')
+        chat2.delete_message('CHAT_ID', ['TURN_ID'])
+        chat2.warmup()
+        chat2.close()
+
+        The first call starts a background thread running an event loop
+        that holds one websocket for this client. Calls from any number
+        of threads share it; replies are matched to their command by the
+        frame router. A connection that dropped is reopened on the next
+        call. Keywords are the same as PyAsyncCAI.chat2.
+
+        """
+
+        def __init__(self, token: str, session: tls_client.Session):
+            self.token = token
+            self.session = session
+            self._bridge = None
+            self._lock = threading.Lock()
+            self._connecting = None
+            self._client = None
+            self._connection = None
+            self._chat2 = None
+
+        def _loop(self):
+            with self._lock:
+                if self._bridge is None or not self._bridge.running:
+                    self._bridge = LoopThread("characterai-chat2")
+                return self._bridge
+
+        async def _connect(self):
+            if self._connecting is None:
+                self._connecting = asyncio.Lock()
+            async with self._connecting:
+                if self._chat2 is not None and self._chat2.router.closed is None:
+                    return self._chat2
+                await self._disconnect()
+
+                _log.debug("Opening chat2 websocket for sync client")
+                if self._client is None:
+                    # kept across reconnects, its threads end in close()
+                    self._client = PyAsyncCAI(
+                        self.session.token,
+                        cassette=getattr(self.session, "cassette", None),
+                        profiler=getattr(self.session, "profiler", None),
+                        traffic=getattr(self.session, "traffic", None),
+                    )
+                connection = self._client.connect(self.token)
+                self._chat2 = await connection.__aenter__()
+                self._connection = connection
+                return self._chat2
+
+        async def _disconnect(self):
+            connection, self._connection, self._chat2 = self._connection, None, None
+            if connection is not None:
+                await connection.__aexit__(None, None, None)
+
+        def _call(self, method: str, *args, **kwargs):
+            async def call():
+                chat2 = await self._connect()
+                return await getattr(chat2, method)(*args, **kwargs)
+
+            return self._loop().run(call())
+
+        def _stream(self, method: str, *args, **kwargs):
+            async def stream():
+                chat2 = await self._connect()
+                deltas = getattr(chat2, method)(*args, **kwargs)
+                try:
+                    async for delta in deltas:
+                        yield delta
+                finally:
+                    # close it here, not whenever the generator is collected
+                    await deltas.aclose()
+
+            return self._loop().iterate(stream())
+
+        def next_message(self, char: str, chat_id: str, parent_msg_uuid: str, **kwargs):
+            return self._call("next_message", char, chat_id, parent_msg_uuid, **kwargs)
+
+        def stream_next_message(
+            self, char: str, chat_id: str, parent_msg_uuid: str, **kwargs
+        ):
+            return self._stream(
+                "stream_next_message", char, chat_id, parent_msg_uuid, **kwargs
             )
+
+        def send_message(
+            self, char: str, chat_id: str, text: str, author: dict = None, **kwargs
+        ):
+            return self._call("send_message", char, chat_id, text, author, **kwargs)
+
+        def stream_message(
+            self, char: str, chat_id: str, text: str, author: dict = None, **kwargs
+        ):
+            return self._stream("stream_message", char, chat_id, text, author, **kwargs)
+
+        def new_chat(self, char: str, chat_id: str, creator_id: str, **kwargs):
+            return self._call("new_chat", char, chat_id, creator_id, **kwargs)
+
+        def delete_message(self, chat_id: str, turn_ids: list, **kwargs):
+            return self._call("delete_message", chat_id, turn_ids, **kwargs)
+
+        def warmup(self):
+            """Open the websocket now instead of on the first call"""
+            self._loop().run(self._connect())
+
+        def close(self):
+            """Close the websocket and stop the background thread"""
+            with self._lock:
+                bridge, self._bridge = self._bridge, None
+            client, self._client = self._client, None
+            if bridge is not None and bridge.running:
+                bridge.run(self._disconnect())
+                if client is not None:
+                    bridge.run(client.close())
+                bridge.stop()
+            self._connecting = None
@@ -0,0 +1,134 @@
+from collections import OrderedDict, deque
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["ContextTracker"]
+
+_TURN_OVERHEAD = 256
+
+
+def _turn_size(turn: dict):
+    size = _TURN_OVERHEAD
+    for candidate in turn.get("candidates") or ():
+        size += len(candidate.get("raw_content") or "")
+    return size
+
+
+class _ChatContext:
+    __slots__ = ("turns", "size")
+
+    def __init__(self, maxlen: int):
+        self.turns = deque(maxlen=maxlen)
+        self.size = 0
+
+
+class ContextTracker:
+    """Last turns of each chat, kept from chat2 traffic
+
+    tracker = ContextTracker(turns=20)
+    client = PyAsyncCAI('TOKEN', context=tracker)
+    tracker.recent_turns('CHAT_ID', 5)
+
+    Every chat keeps a ring buffer of its last `turns` turns. When the
+    estimated size of all buffers exceeds max_bytes, the least recently
+    used chats are evicted.
+
+    """
+
+    def __init__(self, turns: int = 20, *, max_bytes: int = 16 * 1024 * 1024):
+        self.turns = turns
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._chats = OrderedDict()
+
+    def __len__(self):
+        return len(self._chats)
+
+    def __contains__(self, chat_id: str):
+        return chat_id in self._chats
+
+    def record(self, turn: dict):
+        """Add a turn, or replace the stored turn with the same turn_id"""
+        turn_key = turn.get("turn_key") or {}
+        chat_id = turn_key.get("chat_id")
+        if chat_id is None:
+            return
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _ChatContext(self.turns)
+        else:
+            self._chats.move_to_end(chat_id)
+
+        size = _turn_size(turn)
+        turn_id = turn_key.get("turn_id")
+        if turn_id is not None:
+            # streamed updates almost always hit the newest turn
+            for index in range(len(chat.turns) - 1, -1, -1):
+                stored = chat.turns[index]
+                if (stored.get("turn_key") or {}).get("turn_id") == turn_id:
+                    chat.size += size - _turn_size(stored)
+                    self.size += size - _turn_size(stored)
+                    chat.turns[index] = turn
+                    self._evict(chat_id)
+                    return
+
+        if len(chat.turns) == chat.turns.maxlen:
+            dropped = _turn_size(chat.turns[0])
+            chat.size -= dropped
+            self.size -= dropped
+        chat.turns.append(turn)
+        chat.size += size
+        self.size += size
+        self._evict(chat_id)
+
+    def record_history(self, response: dict):
+        """Seed from a chat2.get_history response, newest turn first"""
+        for turn in reversed(response.get("turns") or []):
+            self.record(turn)
+
+    def recent_turns(self, chat_id: str, n: int = None):
+        """Up to n last turns of the chat, oldest first"""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return []
+        self._chats.move_to_end(chat_id)
+        if n is None or n >= len(chat.turns):
+            return list(chat.turns)
+        if n <= 0:
+            return []
+        return list(chat.turns)[-n:]
+
+    def remove_turns(self, chat_id: str, turn_ids: list):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return
+        turn_ids = set(turn_ids)
+        kept = deque(maxlen=chat.turns.maxlen)
+        for turn in chat.turns:
+            if (turn.get("turn_key") or {}).get("turn_id") in turn_ids:
+                chat.size -= _turn_size(turn)
+                self.size -= _turn_size(turn)
+            else:
+                kept.append(turn)
+        chat.turns = kept
+
+    def forget(self, chat_id: str):
+        chat = self._chats.pop(chat_id, None)
+        if chat is not None:
+            self.size -= chat.size
+
+    def clear(self):
+        self._chats.clear()
+        self.size = 0
+
+    def _evict(self, keep: str):
+        while self.size > self.max_bytes and len(self._chats) > 1:
+            chat_id = next(iter(self._chats))
+            if chat_id == keep:
+                self._chats.move_to_end(chat_id)
+                chat_id = next(iter(self._chats))
+            _log.debug(f"Evicting context of chat: {chat_id}")
+            self.forget(chat_id)
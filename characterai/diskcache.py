@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["DiskCache"]
+
+
+class DiskCache:
+    """Persistent cache for slow-changing metadata
+
+    cache = DiskCache('characterai.db', ttl=3600)
+    client = PyCAI('TOKEN', cache=cache)
+
+    Used by character.info, character.categories, character.voices,
+    post.get_topics and user.info. Entries live in an SQLite file in
+    WAL mode, so several processes can share it and a lookup reads a
+    single indexed row. Entries older than `ttl` are still served for
+    up to `stale_ttl` while a background refresh replaces them. Rows
+    written with another `version` are ignored.
+
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        ttl: float = 3600,
+        stale_ttl: float = 86400,
+        version: str = "1",
+        refresh: bool = True,
+    ):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.version = str(version)
+        self.refresh = refresh
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+        # one connection per thread, by thread id so close() reaches all
+        self._connections = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._tasks = set()
+
+    def _connection(self):
+        thread = threading.get_ident()
+        connection = self._connections.get(thread)
+        if connection is None:
+            # only ever used by its own thread, closed from any
+            connection = sqlite3.connect(
+                self.path, timeout=10, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, version TEXT, stored REAL, value TEXT)"
+            )
+            connection.commit()
+            with self._lock:
+                self._connections[thread] = connection
+        return connection
+
+    @staticmethod
+    def key(method: str, link: str, data=None, token: str = None):
+        body = json.dumps(data, sort_keys=True) if data is not None else ""
+        # tokens never reach the file, only a digest to keep users apart
+        owner = hashlib.sha256(token.encode()).hexdigest()[:16] if token else ""
+        return f"{method} {link} {body} {owner}"
+
+    def get(self, key: str):
+        """Returns (value, age) or (None, None) on a miss"""
+        row = (
+            self._connection()
+            .execute("SELECT version, stored, value FROM entries WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None or row[0] != self.version:
+            return None, None
+        age = time.time() - row[1]
+        if age > self.ttl + self.stale_ttl:
+            return None, None
+        return json.loads(row[2]), age
+
+    def set(self, key: str, value):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (key, version, stored, value) "
+            "VALUES (?, ?, ?, ?)",
+            (key, self.version, time.time(), json.dumps(value)),
+        )
+        connection.commit()
+
+    def delete(self, key: str):
+        connection = self._connection()
+        connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        connection.commit()
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute("DELETE FROM entries")
+        connection.commit()
+
+    def _claim(self, key: str):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _release(self, key: str):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def fetch(self, key: str, load):
+        """Cached value of key, calling load() on a miss"""
+        value, age = self.get(key)
+        if age is None:
+            self.misses += 1
+            value = load()
+            self.set(key, value)
+            return value
+
+        if age > self.ttl:
+            self.stale_hits += 1
+            if self.refresh and self._claim(key):
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        2, thread_name_prefix="characterai-cache"
+                    )
+                self._executor.submit(self._refresh, key, load)
+        else:
+            self.hits += 1
+        return value
+
+    def _refresh(self, key: str, load):
+        try:
+            self.set(key, load())
+        except Exception as e:
+            _log.debug(f"Background refresh of {key} failed: {e!r}")
+        finally:
+            self._release(key)
+
+    async def afetch(self, key: str, load):
+        """Same as fetch for a coroutine function load
+
+        SQLite is read and written in worker threads, a lock held by
+        another process does not stall the event loop.
+        """
+        value, age = await asyncio.to_thread(self.get, key)
+        if age is None:
+            self.misses += 1
+            value = await load()
+            await asyncio.to_thread(self.set, key, value)
+            return value
+
+        if age > self.ttl:
+            self.stale_hits += 1
+            if self.refresh and self._claim(key):
+                task = asyncio.ensure_future(self._arefresh(key, load))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        else:
+            self.hits += 1
+        return value
+
+    async def _arefresh(self, key: str, load):
+        try:
+            value = await load()
+            await asyncio.to_thread(self.set, key, value)
+        except Exception as e:
+            _log.debug(f"Background refresh of {key} failed: {e!r}")
+        finally:
+            self._release(key)
+
+    def close(self):
+        """Cancel pending refreshes and close the connections of all threads"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
@@ -0,0 +1,152 @@
+from collections import deque
+import asyncio
+
+from characterai import errors
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["ChatDispatcher"]
+
+
+class ChatDispatcher:
+    """chat2 calls in order per chat, chats in parallel
+
+    async with client.connect() as chat2:
+        dispatcher = ChatDispatcher(chat2, concurrency=16)
+        first = dispatcher.send_message('CHAR', 'CHAT_ID', 'Hi', {AUTHOR})
+        second = dispatcher.send_message('CHAR', 'CHAT_ID', 'And?', {AUTHOR})
+        other = dispatcher.send_message('CHAR', 'OTHER_ID', 'Hi', {AUTHOR})
+        print(await second, await other)
+        await dispatcher.close()
+
+    Every call returns an asyncio future right away. Calls on the same
+    chat_id run one after the other in submission order, since a turn
+    depends on the one before it; calls on different chats run at the
+    same time, at most `concurrency` in total. A failed call fails its
+    own future only, the next call of the chat still runs. Cancelling
+    a future cancels the call, or skips it if it has not started. The
+    queue of a chat is dropped as soon as it runs empty, so idle chats
+    cost nothing.
+
+    """
+
+    def __init__(self, chat2, *, concurrency: int = 16):
+        self.chat2 = chat2
+        self.concurrency = concurrency
+        self._queues = {}
+        self._workers = {}
+        self._slots = None
+        self._running = 0
+        self._closed = False
+
+    @property
+    def pending(self):
+        """Calls submitted and not finished, over all chats"""
+        return sum(map(len, self._queues.values())) + self._running
+
+    def depth(self, chat_id: str):
+        """Calls waiting behind the running one of chat_id"""
+        return len(self._queues.get(chat_id, ()))
+
+    def submit(self, chat_id: str, call, *args, **kwargs):
+        """Queue call(*args, **kwargs), a coroutine function, on chat_id"""
+        if self._closed:
+            raise errors.PyCAIError("ChatDispatcher is closed")
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        queue.append((future, call, args, kwargs))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.ensure_future(self._drain(chat_id))
+        return future
+
+    def next_message(self, char: str, chat_id: str, parent_msg_uuid: str, **kwargs):
+        return self.submit(
+            chat_id, self.chat2.next_message, char, chat_id, parent_msg_uuid, **kwargs
+        )
+
+    def send_message(
+        self, char: str, chat_id: str, text: str, author: dict = None, **kwargs
+    ):
+        return self.submit(
+            chat_id, self.chat2.send_message, char, chat_id, text, author, **kwargs
+        )
+
+    def new_chat(self, char: str, chat_id: str, creator_id: str, **kwargs):
+        return self.submit(
+            chat_id, self.chat2.new_chat, char, chat_id, creator_id, **kwargs
+        )
+
+    def delete_message(self, chat_id: str, turn_ids: list, **kwargs):
+        return self.submit(
+            chat_id, self.chat2.delete_message, chat_id, turn_ids, **kwargs
+        )
+
+    async def _drain(self, chat_id: str):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                future, call, args, kwargs = queue.popleft()
+                if future.done():
+                    continue
+                self._running += 1
+                try:
+                    async with self._slots:
+                        await self._run(future, call, args, kwargs)
+                finally:
+                    self._running -= 1
+        finally:
+            self._queues.pop(chat_id, None)
+            self._workers.pop(chat_id, None)
+            for future, *_ in queue:
+                future.cancel()
+
+    async def _run(self, future, call, args, kwargs):
+        if future.done():
+            return
+        task = asyncio.ensure_future(call(*args, **kwargs))
+        future.add_done_callback(lambda f: task.cancel() if f.cancelled() else None)
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                # the worker itself is being cancelled
+                task.cancel()
+                future.cancel()
+                raise
+            if not future.done():
+                future.cancel()
+        except Exception as e:
+            _log.debug(f"Dispatched call failed: {e!r}")
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self, *, cancel: bool = False):
+        """Wait for the queued calls, or cancel them with cancel=True"""
+        self._closed = True
+        workers = list(self._workers.values())
+        if cancel:
+            # workers cancelled before they started never see their queue
+            for queue in self._queues.values():
+                for future, *_ in queue:
+                    future.cancel()
+            for worker in workers:
+                worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._queues.clear()
+        self._workers.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close(cancel=exc[0] is not None)
+        return False
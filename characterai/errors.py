@@ -12,3 +12,13 @@ class AuthError(PyCAIError):
 
 class PostTypeError(PyCAIError):
     pass
+
+
+class CircuitOpenError(PyCAIError):
+    pass
+
+class CassetteError(PyCAIError):
+    pass
+
+class TimeoutError(PyCAIError, TimeoutError):
+    pass
\ No newline at end of file
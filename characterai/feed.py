@@ -0,0 +1,171 @@
+from collections import OrderedDict
+import asyncio
+
+from characterai import errors, protocol
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["FeedWatcher", "SeenSet"]
+
+
+class SeenSet:
+    """Most recent `maxsize` ids, the oldest forgotten first"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, external_id: str):
+        return external_id in self._ids
+
+    def touch(self, external_id: str):
+        """True if external_id was seen, which makes it the most recent"""
+        if external_id not in self._ids:
+            return False
+        self._ids.move_to_end(external_id)
+        return True
+
+    def add(self, external_id: str):
+        self._ids[external_id] = None
+        self._ids.move_to_end(external_id)
+        if len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+
+class FeedWatcher:
+    """New posts of feeds, users and the account as async streams
+
+    watcher = FeedWatcher(client, interval=30)
+    async for post in watcher.feed('TOPIC'):
+        print(post['external_id'])
+
+    watcher.posts('USERNAME') and watcher.my() watch a user's posts
+    and the account's own. The first poll only records what is already
+    there unless backfill=True. Each poll asks for page 1 with the
+    ETag and Last-Modified of the previous answer, so an unchanged
+    feed costs one 304 when the server supports conditional requests;
+    otherwise pages are read newest first and paging stops at the
+    first page holding a post seen before, so a poll reads as many
+    pages as there are new posts. New posts are yielded oldest first.
+    The interval halves after a poll that found something and grows
+    by half after one that did not, within min_interval and
+    max_interval. Streams of one watcher share its seen-set. Needs a
+    PyAsyncCAI client, the conditional requests go through its send().
+
+    """
+
+    def __init__(
+        self,
+        client,
+        *,
+        interval: float = 30,
+        min_interval: float = 5,
+        max_interval: float = 600,
+        per_page: int = 20,
+        max_pages: int = 10,
+        seen: int = 10000,
+        backfill: bool = False,
+        token: str = None,
+    ):
+        if not asyncio.iscoroutinefunction(getattr(type(client), "send", None)):
+            raise errors.PyCAIError("FeedWatcher needs a PyAsyncCAI client")
+        self.client = client
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.per_page = per_page
+        self.max_pages = max_pages
+        self.backfill = backfill
+        self.token = token
+        self.seen = SeenSet(seen)
+
+        self.polls = 0
+        self.pages = 0
+        self.not_modified = 0
+        self.emitted = 0
+
+    def feed(self, topic: str, *, sort: str = "created"):
+        """New posts of a topic, the feed sorted newest first"""
+        return self._watch(
+            lambda page: protocol.post_feed(topic, page, self.per_page, sort)
+        )
+
+    def posts(self, username: str):
+        return self._watch(
+            lambda page: protocol.post_list(username, page, self.per_page)
+        )
+
+    def my(self):
+        return self._watch(lambda page: protocol.post_my(page, self.per_page))
+
+    async def poll(self, build, validators: dict = None, *, max_pages: int = None):
+        """Posts not seen before, newest first, reading pages until a known one
+
+        validators is updated only when every page was read, a failed
+        poll asks for the same pages again next time.
+        """
+        self.polls += 1
+        fresh = []
+        ids = set()
+        kept = dict(validators) if validators is not None else None
+        for page in range(1, (max_pages or self.max_pages) + 1):
+            response = await type(self.client).send(
+                build(page),
+                self.client.session,
+                token=self.token,
+                validators=kept if page == 1 else None,
+            )
+            self.pages += 1
+            if response is None:
+                self.not_modified += 1
+                break
+
+            posts = response.get("posts") or []
+            known = False
+            for post in posts:
+                external_id = post.get("external_id")
+                if self.seen.touch(external_id):
+                    known = True
+                elif external_id is not None and external_id not in ids:
+                    # posts shift to the next page while we read
+                    ids.add(external_id)
+                    fresh.append(post)
+            if known or len(posts) < self.per_page:
+                break
+        if validators is not None:
+            validators.update(kept)
+        return fresh
+
+    async def _watch(self, build):
+        validators = {}
+        interval = self.interval
+        first = True
+        while True:
+            try:
+                # without backfill the first poll only has to fill the seen-set
+                fresh = await self.poll(
+                    build,
+                    validators,
+                    max_pages=1 if first and not self.backfill else None,
+                )
+            except Exception as e:
+                _log.debug(f"Feed poll failed: {e!r}")
+                interval = min(self.max_interval, interval * 1.5)
+            else:
+                for post in fresh:
+                    self.seen.add(post["external_id"])
+                if not first or self.backfill:
+                    for post in reversed(fresh):
+                        self.emitted += 1
+                        yield post
+                if not first and fresh:
+                    interval = max(self.min_interval, interval / 2)
+                elif not first:
+                    interval = min(self.max_interval, interval * 1.5)
+                first = False
+            await asyncio.sleep(interval)
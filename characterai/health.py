@@ -0,0 +1,225 @@
+import threading
+import time
+
+import tls_client
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["HealthProber"]
+
+
+class HostHealth:
+    """Smoothed probe results of one base URL"""
+
+    __slots__ = (
+        "host",
+        "rtt",
+        "error_rate",
+        "failures",
+        "probes",
+        "errors",
+        "last_probe",
+        "last_error",
+    )
+
+    def __init__(self, host: str):
+        self.host = host
+        self.rtt = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.probes = 0
+        self.errors = 0
+        self.last_probe = None
+        self.last_error = None
+
+    def as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class HealthProber:
+    """Tracks RTT and error rate per base URL and picks the best one
+
+    health = HealthProber(['https://beta.character.ai/',
+                           'https://old.character.ai/'])
+    health.start()
+    client = PyAsyncCAI('TOKEN', health=health)
+    print(health.snapshot())
+    health.stop()
+
+    A daemon thread GETs `host + path` for every host each `interval`
+    seconds, the same request ping() makes against neo. Any response
+    below 500 counts as alive. The clients also report every request
+    they make, so a host degrading between probes is noticed by the
+    next request. Requests go to the host with the lowest smoothed RTT,
+    weighted by its error rate; a host with `fail_after` consecutive
+    failures or an error rate above `max_error_rate` is skipped while
+    another one is eligible. The current host is only left for one
+    that is better by `margin`, so routing does not flap.
+
+    """
+
+    def __init__(
+        self,
+        hosts: list,
+        *,
+        path: str = "ping/",
+        interval: float = 30,
+        timeout: int = 10,
+        smoothing: float = 0.3,
+        max_error_rate: float = 0.5,
+        fail_after: int = 3,
+        margin: float = 0.2,
+    ):
+        if not hosts:
+            raise ValueError("At least one host is required")
+        self.hosts = {host: HostHealth(host) for host in hosts}
+        self.path = path
+        self.interval = interval
+        self.timeout = timeout
+        self.smoothing = smoothing
+        self.max_error_rate = max_error_rate
+        self.fail_after = fail_after
+        self.margin = margin
+
+        self.current = hosts[0]
+        self._order = list(hosts)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._session = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="characterai-health", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval)
+
+    def probe(self):
+        """Probe every host once"""
+        if self._session is None:
+            self._session = tls_client.Session(client_identifier="chrome112")
+        for host in self._order:
+            start = time.monotonic()
+            try:
+                response = self._session.get(
+                    f"{host}{self.path}", timeout_seconds=self.timeout
+                )
+            except Exception as e:
+                self.record(host, ok=False, error=repr(e), probe=True)
+                continue
+            self.observe(host, time.monotonic() - start, response, probe=True)
+
+    def observe(self, host: str, latency: float, response, *, probe: bool = False):
+        """Account a response, None meaning the request did not complete"""
+        if response is None:
+            self.record(host, ok=False, error="No response", probe=probe)
+        elif response.status_code >= 500:
+            self.record(
+                host, ok=False, error=f"HTTP {response.status_code}", probe=probe
+            )
+        else:
+            self.record(host, latency, probe=probe)
+
+    def record(
+        self,
+        host: str,
+        latency: float = None,
+        *,
+        ok: bool = True,
+        error: str = None,
+        probe: bool = False,
+    ):
+        """Account one probe or request against host"""
+        health = self.hosts.get(host)
+        if health is None:
+            return
+        alpha = self.smoothing
+        with self._lock:
+            if probe:
+                health.probes += 1
+                health.last_probe = time.time()
+            if latency is not None and ok:
+                health.rtt = (
+                    latency
+                    if health.rtt is None
+                    else (1 - alpha) * health.rtt + alpha * latency
+                )
+            health.error_rate = (1 - alpha) * health.error_rate + alpha * (not ok)
+            if ok:
+                health.failures = 0
+            else:
+                health.errors += 1
+                health.failures += 1
+                health.last_error = error
+            self._select()
+
+    def _eligible(self, health: HostHealth):
+        return (
+            health.failures < self.fail_after
+            and health.error_rate <= self.max_error_rate
+        )
+
+    def _score(self, health: HostHealth):
+        # hosts nobody measured yet rank after measured ones
+        if health.rtt is None:
+            return float("inf")
+        return health.rtt * (1 + 4 * health.error_rate)
+
+    def _select(self):
+        candidates = [h for h in self.hosts.values() if self._eligible(h)]
+        if not candidates:
+            candidates = list(self.hosts.values())
+        best = min(
+            candidates,
+            key=lambda h: (h.failures, self._score(h), self._order.index(h.host)),
+        )
+        current = self.hosts[self.current]
+        if best is current:
+            return
+        if (
+            current in candidates
+            and best.failures == current.failures
+            and self._score(best) > self._score(current) * (1 - self.margin)
+        ):
+            return
+        _log.debug(f"Switching host from {self.current} to {best.host}")
+        self.current = best.host
+
+    def best(self):
+        """Base URL requests should go to"""
+        return self.current
+
+    def snapshot(self):
+        """Probe results of every host, for dashboards"""
+        with self._lock:
+            return {
+                "current": self.current,
+                "hosts": {
+                    host: {**health.as_dict(), "eligible": self._eligible(health)}
+                    for host, health in self.hosts.items()
+                },
+            }
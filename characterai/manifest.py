@@ -0,0 +1,294 @@
+import asyncio
+import json
+
+from characterai import errors, protocol
+from characterai.ratelimit import RateLimiter
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["CharacterSync", "SyncPlan", "load_manifest"]
+
+# manifest field -> field of the character.info response
+FIELDS = {
+    "name": "name",
+    "title": "title",
+    "description": "description",
+    "greeting": "greeting",
+    "definition": "definition",
+    "categories": "categories",
+    "visibility": "visibility",
+    "copyable": "copyable",
+    "img_gen_enabled": "img_gen_enabled",
+    "base_img_prompt": "base_img_prompt",
+    "avatar_rel_path": "avatar_file_name",
+}
+
+
+def load_manifest(path: str):
+    """Entries of a JSON manifest, a list or {"characters": [...]}"""
+    with open(path, encoding="utf8") as f:
+        manifest = json.load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("characters", [])
+    return manifest
+
+
+def _category_names(value):
+    """Names of categories given as names or as the dicts of the server"""
+    names = []
+    for category in value or ():
+        if isinstance(category, dict):
+            category = category.get("name") or category.get("description")
+        if category:
+            names.append(str(category))
+    return names
+
+
+def _normalize(field: str, value):
+    """Comparable form of a field value, only used to compare"""
+    if field == "categories":
+        return sorted(set(_category_names(value)))
+    if value is None:
+        return "" if field not in ("copyable", "img_gen_enabled") else None
+    return value
+
+
+def diff(entry: dict, current: dict):
+    """{field: (current, wanted)} for the manifest fields that differ
+
+    A field the server did not return counts as changed, equality
+    cannot be shown for it. Values are kept as given, categories in
+    any order compare equal.
+    """
+    changes = {}
+    for field, source in FIELDS.items():
+        if field not in entry:
+            continue
+        wanted = entry[field]
+        if source not in current:
+            changes[field] = (None, wanted)
+            continue
+        value = current[source]
+        if _normalize(field, value) != _normalize(field, wanted):
+            changes[field] = (value, wanted)
+    return changes
+
+
+class SyncPlan:
+    """Creates and updates a manifest needs, and what they returned"""
+
+    def __init__(self):
+        self.creates = []
+        self.updates = []
+        self.unchanged = []
+        self.failed = []
+        self.results = {}
+        # character.info of every character to update, by external_id
+        self.current = {}
+
+    def __len__(self):
+        return len(self.creates) + len(self.updates)
+
+    def report(self):
+        """Plain text dry-run report"""
+        lines = [
+            f"{len(self.creates)} to create, {len(self.updates)} to update, "
+            f"{len(self.unchanged)} unchanged, {len(self.failed)} failed"
+        ]
+        for entry in self.creates:
+            lines.append(f"+ {entry['name']}")
+        for entry, external_id, changes in self.updates:
+            lines.append(f"~ {entry['name']} ({external_id})")
+            for field, (old, new) in changes.items():
+                lines.append(f"    {field}: {old!r} -> {new!r}")
+        for entry, error in self.failed:
+            lines.append(f"! {entry.get('name')}: {error!r}")
+        return "\n".join(lines)
+
+
+class CharacterSync:
+    """Bring the account's characters in line with a manifest
+
+    sync = CharacterSync(client, rate=2)
+    plan = await sync.plan(load_manifest('characters.json'))
+    print(plan.report())
+    await sync.apply(plan)
+
+    Manifest entries are dicts with the keyword arguments of
+    character.create: name, greeting and identifier plus any of
+    title, description, definition, categories, visibility and so on.
+    An entry matches an existing character by its `external_id` or,
+    without one, by name among user.characters(). plan() fetches the
+    state of every matched character concurrently, bypassing the
+    response cache, and keeps only the fields that differ; apply()
+    sends the creates and updates, `concurrency` at a time and no more
+    than `rate` per second. An update resends the current values of
+    the fields the manifest leaves out, the API replaces them all.
+    Works with PyAsyncCAI.
+
+    """
+
+    def __init__(
+        self,
+        client,
+        *,
+        rate: float = 2,
+        burst: float = None,
+        concurrency: int = 8,
+        token: str = None,
+    ):
+        self.client = client
+        self.limiter = RateLimiter(rate, burst)
+        self.concurrency = concurrency
+        self.token = token
+        self._slots = None
+
+    async def _limited(self, call, *args, **kwargs):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            await self.limiter.acquire()
+            return await call(*args, **kwargs)
+
+    async def _info(self, external_id: str):
+        response = await type(self.client).send(
+            protocol.character_info(external_id),
+            self.client.session,
+            token=self.token,
+            use_cache=False,
+        )
+        return response.get("character") or {}
+
+    def _forget(self, external_id: str):
+        """Drop the cached character.info of a character that changed"""
+        session = self.client.session
+        cache = getattr(session, "cache", None)
+        if cache is None:
+            return
+        request = protocol.character_info(external_id)
+        cache.delete(
+            cache.key(
+                request.method,
+                protocol.link(request, session.url),
+                request.data,
+                self.token or session.token,
+            )
+        )
+
+    async def plan(self, manifest: list):
+        plan = SyncPlan()
+        owned = await self._limited(self.client.user.characters, token=self.token)
+        by_name = {}
+        for char in owned.get("characters") or ():
+            name = char.get("name") or char.get("participant__name")
+            if name:
+                by_name.setdefault(name, char.get("external_id"))
+
+        async def check(entry: dict):
+            external_id = entry.get("external_id") or by_name.get(entry.get("name"))
+            if external_id is None:
+                plan.creates.append(entry)
+                return
+            try:
+                current = await self._limited(self._info, external_id)
+            except Exception as e:
+                plan.failed.append((entry, e))
+                return
+            changes = diff(entry, current)
+            if changes:
+                plan.updates.append((entry, external_id, changes))
+                plan.current[external_id] = current
+            else:
+                plan.unchanged.append((entry, external_id))
+
+        await asyncio.gather(*(check(entry) for entry in manifest))
+        _log.debug(
+            f"Sync plan: {len(plan.creates)} creates, {len(plan.updates)} updates"
+        )
+        return plan
+
+    async def apply(self, plan: SyncPlan):
+        """Send the plan, results hold responses or exceptions
+
+        Updates are keyed by external_id, creates by their identifier
+        (their name when the entry has none), so characters sharing a
+        name keep their own results.
+        """
+
+        async def create(entry: dict):
+            fields = {k: v for k, v in entry.items() if k != "external_id"}
+            try:
+                greeting = fields.pop("greeting")
+                identifier = fields.pop("identifier")
+                name = fields.pop("name")
+            except KeyError as e:
+                raise errors.PyCAIError(f"Manifest entry lacks {e}") from None
+            return await self._limited(
+                self.client.character.create,
+                greeting,
+                identifier,
+                name,
+                token=self.token,
+                **fields,
+            )
+
+        async def update(entry: dict, external_id: str):
+            current = plan.current.get(external_id, {})
+            values = {
+                field: current[source]
+                for field, source in FIELDS.items()
+                if source in current
+            }
+            if "categories" in values:
+                values["categories"] = _category_names(values["categories"])
+            values.update(
+                (k, v)
+                for k, v in entry.items()
+                if k not in ("external_id", "identifier")
+            )
+            missing = [field for field in ("greeting", "name") if field not in values]
+            if missing:
+                # sending "" would blank them on the server
+                raise errors.PyCAIError(
+                    f"No {' or '.join(missing)} for {external_id}, not updating"
+                )
+            identifier = current.get("identifier") or entry.get("identifier", "")
+            response = await self._limited(
+                self.client.character.update,
+                external_id,
+                values.pop("greeting"),
+                identifier,
+                values.pop("name"),
+                token=self.token,
+                **values,
+            )
+            self._forget(external_id)
+            return response
+
+        async def run(key: str, call, *args):
+            try:
+                plan.results[key] = await call(*args)
+            except Exception as e:
+                _log.debug(f"Syncing {key} failed: {e!r}")
+                plan.results[key] = e
+
+        await asyncio.gather(
+            *(
+                run(entry.get("identifier") or entry.get("name"), create, entry)
+                for entry in plan.creates
+            ),
+            *(
+                run(external_id, update, entry, external_id)
+                for entry, external_id, _ in plan.updates
+            ),
+        )
+        return plan.results
+
+    async def run(self, manifest: list, *, dry_run: bool = False):
+        """plan() and, unless dry_run, apply()"""
+        plan = await self.plan(manifest)
+        if not dry_run and plan:
+            await self.apply(plan)
+        return plan
@@ -0,0 +1,165 @@
+import re
+import threading
+import time
+import tracemalloc
+
+__all__ = ["Profiler"]
+
+PHASES = (
+    "queue",
+    "send",
+    "first_frame",
+    "recv",
+    "log",
+    "decode",
+    "classify",
+    "callback",
+)
+
+_ID_SEGMENT = re.compile(r"(?<=/)(?=[\w-]*\d)[\w-]{16,}(?=/|$)")
+
+
+def endpoint_name(url: str):
+    """'turns/CHAT_ID/' -> 'turns/{id}/', query strings dropped"""
+    return _ID_SEGMENT.sub("{id}", url.split("?", 1)[0])
+
+
+class Span:
+    """Timing of one request or chat2 command, phase by phase"""
+
+    __slots__ = ("profiler", "endpoint", "started", "last", "phases", "memory")
+
+    def __init__(self, profiler, endpoint: str):
+        self.profiler = profiler
+        self.endpoint = endpoint
+        self.started = self.last = time.perf_counter()
+        self.phases = []
+        self.memory = (
+            tracemalloc.get_traced_memory()[0] if profiler.allocations else None
+        )
+
+    def mark(self, phase: str):
+        """Account the time since the previous mark to phase"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def end(self, *, failed: bool = False):
+        if self.profiler is None:
+            return
+        allocated = None
+        if self.memory is not None:
+            allocated = tracemalloc.get_traced_memory()[0] - self.memory
+        self.profiler._add(self, time.perf_counter() - self.started, allocated, failed)
+        self.profiler = None
+
+
+class Profiler:
+    """Phase timings of the client hot paths
+
+    profiler = Profiler(allocations=True)
+    client = PyAsyncCAI('TOKEN', profiler=profiler)
+    ...
+    print(profiler.report())
+    profiler.dump('characterai.folded')
+
+    HTTP requests are split into queue (rate limiter), send (the whole
+    tls_client round trip: connect, first byte and body are not
+    observable separately), log, decode and classify (the error
+    checks). chat2 commands are split into queue, send, first_frame,
+    recv, decode, classify and callback, the time the caller spent
+    between two frames. dump() writes collapsed stacks in microseconds
+    for flamegraph.pl or speedscope.
+
+    With allocations=True tracemalloc is started and the net traced
+    memory of each call is added to its endpoint; concurrent calls
+    blur each other's numbers. Without a profiler the clients only pay
+    a None check per phase.
+
+    """
+
+    def __init__(self, *, allocations: bool = False, frames: int = 1):
+        self.allocations = allocations
+        self.stats = {}
+        self._lock = threading.Lock()
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def span(self, endpoint: str):
+        return Span(self, endpoint_name(endpoint))
+
+    def _add(self, span: Span, total: float, allocated: int, failed: bool):
+        with self._lock:
+            stats = self.stats.get(span.endpoint)
+            if stats is None:
+                stats = self.stats[span.endpoint] = {
+                    "calls": 0,
+                    "failed": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "allocated": 0,
+                    "phases": {},
+                }
+            stats["calls"] += 1
+            stats["failed"] += failed
+            stats["total"] += total
+            stats["max"] = max(stats["max"], total)
+            if allocated is not None:
+                stats["allocated"] += allocated
+            phases = stats["phases"]
+            for phase, elapsed in span.phases:
+                count, spent, longest = phases.get(phase, (0, 0.0, 0.0))
+                phases[phase] = (count + 1, spent + elapsed, max(longest, elapsed))
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def top_allocations(self, limit: int = 10):
+        """Source lines holding the most traced memory right now"""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.statistics("lineno")[:limit]
+
+    def report(self):
+        """Plain text summary, slowest endpoints first"""
+        with self._lock:
+            stats = sorted(
+                self.stats.items(), key=lambda item: item[1]["total"], reverse=True
+            )
+            lines = []
+            for endpoint, entry in stats:
+                calls = entry["calls"]
+                line = (
+                    f"{endpoint}: {calls} calls, {entry['failed']} failed, "
+                    f"mean {entry['total'] / calls * 1000:.2f} ms, "
+                    f"max {entry['max'] * 1000:.2f} ms"
+                )
+                if self.allocations:
+                    line += f", {entry['allocated'] / calls:.0f} B/call"
+                lines.append(line)
+                for phase in sorted(
+                    entry["phases"],
+                    key=lambda p: PHASES.index(p) if p in PHASES else 99,
+                ):
+                    count, spent, longest = entry["phases"][phase]
+                    lines.append(
+                        f"    {phase:<12} {spent / calls * 1000:9.3f} ms/call "
+                        f"{spent / entry['total'] * 100 if entry['total'] else 0:5.1f}% "
+                        f"max {longest * 1000:.3f} ms"
+                    )
+            return "\n".join(lines)
+
+    def collapsed(self):
+        """Collapsed stacks, one 'characterai;endpoint;phase microseconds' per line"""
+        with self._lock:
+            lines = []
+            for endpoint, entry in self.stats.items():
+                for phase, (_, spent, _) in entry["phases"].items():
+                    lines.append(f"characterai;{endpoint};{phase} {round(spent * 1e6)}")
+            return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf8") as f:
+            f.write(self.collapsed())
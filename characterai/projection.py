@@ -0,0 +1,266 @@
+import json
+import re
+
+__all__ = ["project", "parse_path"]
+
+_PATH = re.compile(r"([^.\[\]]+)|\[(\d+|\*)\]")
+_SPECIAL = re.compile(r'["\[\]{}]')
+_STRING_BODY = r'[^"\\]*(?:\\.[^"\\]*)*"'
+_STRING_END = re.compile(_STRING_BODY, re.DOTALL)
+_SCALAR = re.compile(r"[^,}\]\s]*")
+_SPACE = re.compile(r"\s*")
+_ERROR = re.compile(
+    r'\s*\{\s*"(?:command"\s*:\s*"neo_error|detail"\s*:\s*"Auth|status"\s*:\s*"Error|error")'
+)
+
+
+def _nested(depth: int):
+    """Regex matching any object or array nested at most depth levels
+
+    Written as unrolled loops so a failed match cannot backtrack
+    exponentially; this lets `re` skip whole subtrees in one C call.
+
+    """
+    plain = r'[^"\[\]{}]*'
+    value = None
+    for _ in range(depth):
+        inner = '"' + _STRING_BODY if value is None else f'"{_STRING_BODY}|{value}'
+        body = f"{plain}(?:(?:{inner}){plain})*"
+        value = f"(?:\\{{{body}\\}}|\\[{body}\\])"
+    return re.compile(value, re.DOTALL)
+
+
+_container = None
+
+_decoder = json.JSONDecoder()
+_scanstring = json.decoder.scanstring
+_WILDCARD = "*"
+
+
+def parse_path(path: str):
+    """'replies[0].text' -> ['replies', 0, 'text']"""
+    steps = []
+    for key, index in _PATH.findall(path):
+        if key:
+            steps.append(key)
+        elif index == _WILDCARD:
+            steps.append(_WILDCARD)
+        else:
+            steps.append(int(index))
+    return steps
+
+
+def may_be_error(text: str):
+    """True if the body starts like one of the error payloads the clients check"""
+    return _ERROR.match(text) is not None
+
+
+class _Node:
+    __slots__ = ("children", "paths", "_leaves")
+
+    def __init__(self):
+        self.children = {}
+        self.paths = []
+        self._leaves = None
+
+    def leaves(self):
+        """This node and the nodes below it that end a path"""
+        if self._leaves is None:
+            self._leaves = [self] if self.paths else []
+            for child in self.children.values():
+                self._leaves += child.leaves()
+        return self._leaves
+
+
+def _build(fields):
+    root = _Node()
+    for path in fields:
+        node = root
+        for step in parse_path(path):
+            node = node.children.setdefault(step, _Node())
+        node.paths.append(path)
+    return root
+
+
+def _skip_space(text: str, pos: int):
+    return _SPACE.match(text, pos).end()
+
+
+def _skip(text: str, pos: int):
+    """Position right after the value starting at pos"""
+    char = text[pos]
+    if char == '"':
+        return _STRING_END.match(text, pos + 1).end()
+    if char not in "[{":
+        return _SCALAR.match(text, pos).end()
+
+    global _container
+    if _container is None:
+        _container = _nested(4)
+    match = _container.match(text, pos)
+    if match is not None:
+        return match.end()
+
+    # nested deeper than the regex handles, walk it bracket by bracket
+    depth = 0
+    search = _SPECIAL.search
+    while True:
+        match = search(text, pos)
+        char = match.group()
+        pos = match.end()
+        if char == '"':
+            pos = _STRING_END.match(text, pos).end()
+        elif char in "[{":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _gather(every: _Node):
+    """Values per leaf under a wildcard, [] for a leaf no item matched
+
+    Every item of the array leaves its list in the result, so nested
+    wildcards keep the position of each outer item.
+    """
+    return {leaf: [] for leaf in every.leaves()}
+
+
+class _Projector:
+    def __init__(self, text: str, root: _Node, wanted: int, wildcard: bool):
+        self.text = text
+        self.found = {}
+        self.remaining = wanted
+        self.wildcard = wildcard
+
+    def value(self, pos: int, node: _Node, collect: list = None):
+        """Read the value at pos for node, returns the position after it"""
+        text = self.text
+        if node.paths:
+            value, end = _decoder.raw_decode(text, pos)
+            self._resolve(value, node, collect)
+            return end
+
+        char = text[pos]
+        if char == "{":
+            return self._object(pos + 1, node, collect)
+        if char == "[":
+            return self._array(pos + 1, node, collect)
+        return _skip(text, pos)
+
+    def _resolve(self, value, node: _Node, collect):
+        """Same as value() for an already decoded value"""
+        if node.paths:
+            self._store(node, value, collect)
+        for step, child in node.children.items():
+            if step == _WILDCARD:
+                if isinstance(value, list):
+                    items = []
+                    for item in value:
+                        self._resolve(item, child, items)
+                    gathered = _gather(child)
+                    for leaf, found in items:
+                        gathered.setdefault(leaf, []).append(found)
+                    for leaf, found in gathered.items():
+                        self._store(leaf, found, collect)
+            elif isinstance(step, int):
+                if isinstance(value, list) and step < len(value):
+                    self._resolve(value[step], child, collect)
+            elif isinstance(value, dict) and step in value:
+                self._resolve(value[step], child, collect)
+
+    def _store(self, node: _Node, value, collect):
+        if collect is not None:
+            collect.append((node, value))
+            return
+        for path in node.paths:
+            if path not in self.found:
+                self.remaining -= 1
+            self.found[path] = value
+
+    def _object(self, pos: int, node: _Node, collect):
+        text = self.text
+        pos = _skip_space(text, pos)
+        if text[pos] == "}":
+            return pos + 1
+        while True:
+            key, pos = _scanstring(text, pos + 1)
+            pos = _skip_space(text, pos)
+            pos = _skip_space(text, pos + 1)  # ':'
+            child = node.children.get(key)
+            if child is None:
+                pos = _skip(text, pos)
+            else:
+                pos = self.value(pos, child, collect)
+                if not self.remaining and not self.wildcard:
+                    return None
+            if pos is None:
+                return None
+            pos = _skip_space(text, pos)
+            if text[pos] == "}":
+                return pos + 1
+            pos = _skip_space(text, pos + 1)  # ','
+
+    def _array(self, pos: int, node: _Node, collect):
+        text = self.text
+        pos = _skip_space(text, pos)
+        every = node.children.get(_WILDCARD)
+        gathered = _gather(every) if every is not None else None
+        index = 0
+        while text[pos] != "]":
+            child = node.children.get(index)
+            if child is not None and every is not None:
+                value, pos = _decoder.raw_decode(text, pos)
+                self._resolve(value, child, collect)
+                items = []
+                self._resolve(value, every, items)
+                for leaf, found in items:
+                    gathered.setdefault(leaf, []).append(found)
+            elif child is not None:
+                pos = self.value(pos, child, collect)
+                if not self.remaining and not self.wildcard:
+                    return None
+            elif every is not None:
+                items = []
+                pos = self.value(pos, every, items)
+                for leaf, value in items:
+                    gathered.setdefault(leaf, []).append(value)
+            else:
+                pos = _skip(text, pos)
+            if pos is None:
+                return None
+            pos = _skip_space(text, pos)
+            index += 1
+            if text[pos] == ",":
+                pos = _skip_space(text, pos + 1)
+        pos += 1
+
+        if gathered is not None:
+            for leaf, values in gathered.items():
+                self._store(leaf, values, collect)
+        return pos
+
+
+def project(text: str, fields, default=None):
+    """Extract only the given paths from a JSON document
+
+    project(body, ['replies[0].text', 'src_char.participant.name'])
+    project(body, ['histories[*].external_id'])
+
+    Returns a dict keyed by path; missing paths map to default, or to
+    an empty list for wildcard paths. Everything outside the requested
+    paths is skipped without being decoded or allocated, and scanning
+    stops as soon as every path without a wildcard has been found.
+
+    """
+    root = _build(fields)
+    wildcard = any(_WILDCARD in parse_path(path) for path in fields)
+    projector = _Projector(text, root, len(set(fields)), wildcard)
+    projector.value(_skip_space(text, 0), root)
+
+    found = projector.found
+    for path in fields:
+        if path not in found:
+            found[path] = [] if _WILDCARD in parse_path(path) else default
+    return found
@@ -0,0 +1,613 @@
+"""Transport-agnostic core shared by PyCAI and PyAsyncCAI
+
+Endpoint functions return Request descriptors; nothing here does I/O.
+A client turns a descriptor into an HTTP call with link() and
+headers(), then hands the body to decode() and check(). chat2
+websocket commands are built and their frames parsed the same way.
+
+"""
+
+import json
+
+from characterai import errors, projection
+
+__all__ = ["Request"]
+
+NEO_URL = "https://neo.character.ai/"
+WS_URL = "wss://neo.character.ai/ws/"
+PING_URL = f"{NEO_URL}ping/"
+
+
+def web_url(sub: str):
+    """Base URL of the legacy web API, sub being 'old', 'beta' or 'plus'"""
+    return f"https://{sub}.character.ai/"
+
+
+class Request:
+    """One HTTP call, described without performing it"""
+
+    __slots__ = ("path", "method", "data", "split", "neo", "cached")
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        method: str = "GET",
+        data: dict = None,
+        split: bool = False,
+        neo: bool = False,
+        cached: bool = False,
+    ):
+        self.path = path
+        self.method = method
+        self.data = data
+        self.split = split
+        self.neo = neo
+        self.cached = cached
+
+    def __repr__(self):
+        return f"<Request {self.method} {self.path}>"
+
+
+def link(request: Request, base_url: str):
+    return f"{NEO_URL}{request.path}" if request.neo else f"{base_url}{request.path}"
+
+
+def headers(token: str, accept_encoding: str = None):
+    headers = {"Authorization": f"Token {token}"}
+    if accept_encoding is not None:
+        headers["Accept-Encoding"] = accept_encoding
+    return headers
+
+
+def header(response, name: str):
+    """Header of a tls_client response, None when missing"""
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get(name)
+    if value is None:
+        value = headers.get(name.lower())
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value
+
+
+def conditional(headers: dict, validators: dict):
+    """Add the If-None-Match / If-Modified-Since of earlier validators"""
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def validate(response, validators: dict):
+    """Keep the validators of response, True if it was 304 Not Modified"""
+    etag = header(response, "ETag")
+    if etag:
+        validators["etag"] = etag
+    last_modified = header(response, "Last-Modified")
+    if last_modified:
+        validators["last_modified"] = last_modified
+    return response.status_code == 304
+
+
+def body(request: Request, text: str):
+    """JSON text of a response, the last line of a streamed one"""
+    # rsplit keeps the earlier snapshots of a streamed reply out of a list
+    return text.rsplit("\n", 2)[-2] if request.split else text
+
+
+def decode(request: Request, text: str, fields: list = None):
+    """Returns (data, projected), projecting fields when given"""
+    text = body(request, text)
+    if fields is not None and not projection.may_be_error(text):
+        return projection.project(text, fields), True
+    return json.loads(text), False
+
+
+def check(data):
+    """Raise for the error payloads the API answers with, else return data
+
+    Same rules as matching the start of str(data), without rendering
+    the whole response to a string: only the first key is looked at.
+
+    """
+    if not isinstance(data, dict) or not data:
+        return data
+    key, value = next(iter(data.items()))
+    value = value if isinstance(value, str) else ""
+    if key == "command" and value.startswith("neo_error"):
+        raise errors.ServerError(data["comment"])
+    elif key == "detail" and value.startswith("Auth"):
+        raise errors.AuthError("Invalid token")
+    elif key == "status" and value.startswith("Error"):
+        raise errors.ServerError(data["status"])
+    elif key == "error":
+        raise errors.ServerError(data["error"])
+    return data
+
+
+def parse(request: Request, text: str, fields: list = None):
+    data, projected = decode(request, text, fields)
+    return data if projected else check(data)
+
+
+# user
+
+
+def user_info():
+    return Request("chat/user/", cached=True)
+
+
+def user_profile(username: str):
+    return Request("chat/user/public/", method="POST", data={"username": username})
+
+
+def user_followers():
+    return Request("chat/user/followers/")
+
+
+def user_following():
+    return Request("chat/user/following/")
+
+
+def user_recent():
+    return Request("chat/characters/recent/")
+
+
+def user_characters():
+    return Request("chat/characters/?scope=user")
+
+
+def user_update(username: str, **kwargs):
+    return Request(
+        "chat/user/update/", method="POST", data={"username": username, **kwargs}
+    )
+
+
+# post
+
+
+def post_get(post_id: str):
+    return Request(f"chat/post/?post={post_id}")
+
+
+def post_my(posts_page: int = 1, posts_to_load: int = 5):
+    return Request(
+        f"chat/posts/user/?scope=user&page={posts_page}"
+        f"&posts_to_load={posts_to_load}/"
+    )
+
+
+def post_list(username: str, posts_page: int = 1, posts_to_load: int = 5):
+    return Request(
+        f"chat/posts/user/?username={username}"
+        f"&page={posts_page}&posts_to_load={posts_to_load}/"
+    )
+
+
+def post_upvote(post_external_id: str):
+    return Request(
+        "chat/post/upvote/",
+        method="POST",
+        data={"post_external_id": post_external_id},
+    )
+
+
+def post_undo_upvote(post_external_id: str):
+    return Request(
+        "chat/post/undo-upvote/",
+        method="POST",
+        data={"post_external_id": post_external_id},
+    )
+
+
+def post_comment(post_id: str, text: str, parent_uuid: str = None):
+    return Request(
+        "chat/comment/create/",
+        method="POST",
+        data={"post_external_id": post_id, "text": text, "parent_uuid": parent_uuid},
+    )
+
+
+def post_delete_comment(message_id: int, post_id: str):
+    return Request(
+        "chat/comment/delete/",
+        method="POST",
+        data={"external_id": message_id, "post_external_id": post_id},
+    )
+
+
+def post_create(
+    post_type: str,
+    external_id: str,
+    title: str,
+    text: str = "",
+    post_visibility: str = "PUBLIC",
+    **kwargs,
+):
+    if post_type == "POST":
+        return Request(
+            "chat/post/create/",
+            method="POST",
+            data={
+                "post_title": title,
+                "topic_external_id": external_id,
+                "post_text": text,
+                **kwargs,
+            },
+        )
+    elif post_type == "CHAT":
+        return Request(
+            "chat/chat-post/create/",
+            method="POST",
+            data={
+                "post_title": title,
+                "subject_external_id": external_id,
+                "post_visibility": post_visibility,
+                **kwargs,
+            },
+        )
+    raise errors.PostTypeError("Invalid post_type")
+
+
+def post_delete(post_id: str):
+    return Request("chat/post/delete/", method="POST", data={"external_id": post_id})
+
+
+def post_topics():
+    return Request("chat/topics/", cached=True)
+
+
+def post_feed(topic: str, num: int = 1, load: int = 5, sort: str = "top"):
+    return Request(
+        f"chat/posts/?topic={topic}&page={num}&posts_to_load={load}&sort={sort}"
+    )
+
+
+# character
+
+
+def character_create(
+    greeting: str,
+    identifier: str,
+    name: str,
+    *,
+    avatar_rel_path: str = "",
+    base_img_prompt: str = "",
+    categories: list = None,
+    copyable: bool = True,
+    definition: str = "",
+    description: str = "",
+    title: str = "",
+    img_gen_enabled: bool = False,
+    visibility: str = "PUBLIC",
+    **kwargs,
+):
+    return Request(
+        "../chat/character/create/",
+        method="POST",
+        data={
+            "greeting": greeting,
+            "identifier": identifier,
+            "name": name,
+            "avatar_rel_path": avatar_rel_path,
+            "base_img_prompt": base_img_prompt,
+            "categories": [] if categories is None else categories,
+            "copyable": copyable,
+            "definition": definition,
+            "description": description,
+            "img_gen_enabled": img_gen_enabled,
+            "title": title,
+            "visibility": visibility,
+            **kwargs,
+        },
+    )
+
+
+def character_update(
+    external_id: str,
+    greeting: str,
+    identifier: str,
+    name: str,
+    title: str = "",
+    categories: list = None,
+    definition: str = "",
+    copyable: bool = True,
+    description: str = "",
+    visibility: str = "PUBLIC",
+    **kwargs,
+):
+    return Request(
+        "../chat/character/update/",
+        method="POST",
+        data={
+            "external_id": external_id,
+            "name": name,
+            "categories": [] if categories is None else categories,
+            "title": title,
+            "visibility": visibility,
+            "copyable": copyable,
+            "description": description,
+            "greeting": greeting,
+            "definition": definition,
+            **kwargs,
+        },
+    )
+
+
+def character_trending():
+    return Request("chat/characters/trending/")
+
+
+def character_recommended():
+    return Request("chat/characters/recommended/")
+
+
+def character_categories():
+    return Request("chat/character/categories/", cached=True)
+
+
+def character_info(char: str):
+    return Request(
+        "chat/character/", method="POST", data={"external_id": char}, cached=True
+    )
+
+
+def character_search(query: str):
+    return Request(f"chat/characters/search/?query={query}/")
+
+
+def character_voices():
+    return Request("chat/character/voices/", cached=True)
+
+
+# chat
+
+
+RATE_LABELS = {
+    0: [234, 238, 241, 244],  # Terrible
+    1: [235, 237, 241, 244],  # Bad
+    2: [235, 238, 240, 244],  # Good
+    3: [235, 238, 241, 243],  # Fantastic
+}
+
+
+def chat_create_room(characters: list, name: str, topic: str = "", **kwargs):
+    return Request(
+        "../chat/room/create/",
+        method="POST",
+        data={
+            "characters": characters,
+            "name": name,
+            "topic": topic,
+            "visibility": "PRIVATE",
+            **kwargs,
+        },
+    )
+
+
+def chat_rate(rate: int, history_id: str, message_id: str, **kwargs):
+    if rate not in RATE_LABELS:
+        raise errors.LabelError("Wrong Rate Value")
+    return Request(
+        "chat/annotations/label/",
+        method="PUT",
+        data={
+            "label_ids": RATE_LABELS[rate],
+            "history_external_id": history_id,
+            "message_uuid": message_id,
+            **kwargs,
+        },
+    )
+
+
+def chat_next_message(history_id: str, parent_msg_uuid: str, tgt: str, **kwargs):
+    return Request(
+        "chat/streaming/",
+        method="POST",
+        split=True,
+        data={
+            "history_external_id": history_id,
+            "parent_msg_uuid": parent_msg_uuid,
+            "tgt": tgt,
+            **kwargs,
+        },
+    )
+
+
+def chat_histories(char: str, number: int = 50):
+    return Request(
+        "chat/character/histories_v2/",
+        method="POST",
+        data={"external_id": char, "number": number},
+    )
+
+
+def chat_history(history_id: str):
+    return Request(f"chat/history/msgs/user/?history_external_id={history_id}")
+
+
+def chat_continue(char: str, **kwargs):
+    return Request(
+        "chat/history/continue/",
+        method="POST",
+        data={"character_external_id": char, **kwargs},
+    )
+
+
+def chat_send_message(history_id: str, tgt: str, text: str, **kwargs):
+    return Request(
+        "chat/streaming/",
+        method="POST",
+        split=True,
+        data={"history_external_id": history_id, "tgt": tgt, "text": text, **kwargs},
+    )
+
+
+def chat_delete_message(history_id: str, uuids_to_delete: list, **kwargs):
+    return Request(
+        "chat/history/msgs/delete/",
+        method="POST",
+        data={"history_id": history_id, "uuids_to_delete": uuids_to_delete, **kwargs},
+    )
+
+
+def chat_new(char: str):
+    return Request(
+        "chat/history/create/", method="POST", data={"character_external_id": char}
+    )
+
+
+# chat2 over HTTP
+
+
+def chat2_histories(char: str, preview: int = 2):
+    return Request(f"chats/?character_ids={char}&num_preview_turns={preview}", neo=True)
+
+
+def chat2_recent(char: str):
+    return Request(f"chats/recent/{char}", neo=True)
+
+
+def chat2_turns(chat_id: str):
+    return Request(f"turns/{chat_id}/", neo=True)
+
+
+# star ratings of chat2 turns
+STARS = (1, 2, 3, 4)
+
+
+def chat2_rate(rate: int, chat_id: str, turn_id: str, candidate_id: str):
+    if rate not in STARS:
+        raise errors.LabelError("Wrong Rate Value")
+    return Request(
+        "annotation/create",
+        method="POST",
+        neo=True,
+        data={
+            "turn_key": {"chat_id": chat_id, "turn_id": turn_id},
+            "candidate_id": candidate_id,
+            "annotation": {"annotation_type": "star", "annotation_value": rate},
+        },
+    )
+
+
+# chat2 websocket
+
+
+def next_message_command(char: str, chat_id: str, parent_msg_uuid: str):
+    return {
+        "command": "generate_turn_candidate",
+        "payload": {
+            "character_id": char,
+            "turn_key": {"turn_id": parent_msg_uuid, "chat_id": chat_id},
+        },
+    }
+
+
+def send_message_command(
+    char: str,
+    chat_id: str,
+    text: str,
+    author: dict = None,
+    turn_id: str = None,
+    custom_id: str = None,
+    candidate_id: str = None,
+):
+    if custom_id is not None:
+        turn_key = {"turn_id": custom_id, "chat_id": chat_id}
+    else:
+        turn_key = {"chat_id": chat_id}
+
+    message = {
+        "command": "create_and_generate_turn",
+        "payload": {
+            "character_id": char,
+            "turn": {
+                "turn_key": turn_key,
+                "author": author,
+                "candidates": [{"raw_content": text}],
+            },
+        },
+    }
+
+    if turn_id is not None and candidate_id is not None:
+        message["update_primary_candidate"] = {
+            "candidate_id": candidate_id,
+            "turn_key": {"turn_id": turn_id, "chat_id": chat_id},
+        }
+
+    return message
+
+
+def create_chat_command(
+    char: str, chat_id: str, creator_id: str, with_greeting: bool = True
+):
+    return {
+        "command": "create_chat",
+        "payload": {
+            "chat": {
+                "chat_id": chat_id,
+                "creator_id": creator_id,
+                "visibility": "VISIBILITY_PRIVATE",
+                "character_id": char,
+                "type": "TYPE_ONE_ON_ONE",
+            },
+            "with_greeting": with_greeting,
+        },
+    }
+
+
+def remove_turns_command(chat_id: str, turn_ids: list):
+    return {
+        "command": "remove_turns",
+        "payload": {"chat_id": chat_id, "turn_ids": turn_ids},
+    }
+
+
+def abort_command(request_id: str, chat_id: str):
+    return {
+        "command": "abort_generation",
+        "request_id": request_id,
+        "payload": {"chat_id": chat_id},
+    }
+
+
+def load_frame(raw):
+    """Decoded websocket frame, frames the router decoded pass through"""
+    return json.loads(raw) if isinstance(raw, str) else raw
+
+
+def turn_frame(raw):
+    """Decoded turn frame, ServerError for an error frame"""
+    response = load_frame(raw)
+    if "turn" not in response:
+        raise errors.ServerError(response.get("comment"))
+    return response
+
+
+def chat_frame(raw):
+    """Decoded create_chat reply, ServerError for an error frame"""
+    response = load_frame(raw)
+    if "chat" not in response:
+        raise errors.ServerError(response.get("comment"))
+    return response
+
+
+def is_character_turn(response: dict):
+    """Human turns carry a numeric author id"""
+    return not response["turn"]["author"]["author_id"].isdigit()
+
+
+def is_final_turn(response: dict):
+    candidates = response["turn"].get("candidates") or [{}]
+    return "is_final" in candidates[0]
+
+
+def command_reply(raw):
+    """Decoded reply of a command without turns, ServerError on neo_error"""
+    response = load_frame(raw)
+    if response.get("command") == "neo_error":
+        raise errors.ServerError(response.get("comment"))
+    return response
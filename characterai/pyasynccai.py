@@ -1,11 +1,22 @@
-from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+import functools
 import websockets
 import tls_client
 import asyncio
 import json
+import time
 import logging
 
-from characterai import errors
+from characterai import errors, protocol, streaming
+from characterai.cassette import Cassette
+from characterai.context import ContextTracker
+from characterai.diskcache import DiskCache
+from characterai.health import HealthProber
+from characterai.profiling import Profiler
+from characterai.ratelimit import AdaptiveLimiter
+from characterai.router import FrameRouter
+from characterai.traffic import Traffic
 
 _log = logging.getLogger(__name__)
 
@@ -13,108 +24,373 @@ __all__ = ['PyCAI', 'PyAsyncCAI']
 
 class PyAsyncCAI:
     def __init__(
-        self, token: str = None, plus: bool = False
+        self, token: str = None, plus: bool = False,
+        *, context: ContextTracker = None,
+        limiter: AdaptiveLimiter = None,
+        cassette: Cassette = None,
+        cache: DiskCache = None,
+        health: HealthProber = None,
+        profiler: Profiler = None,
+        http2: bool = True, concurrency: int = 32,
+        traffic: Traffic = None,
+        accept_encoding: str = 'gzip, deflate, br'
     ):
         _log.debug("Initializing PyAsyncCAI")
         self.token = token
+        self.context = context
+        self._warm = None
+        self._keepalive = None
 
         sub = 'plus' if plus else 'beta'
+        # chrome112 offers h2 in ALPN, so each host gets one connection
+        # that concurrent requests are multiplexed over
         self.session = tls_client.Session(
-            client_identifier='chrome112'
+            client_identifier='chrome112',
+            force_http1=not http2
         )
 
-        setattr(self.session, 'url', f'https://{sub}.character.ai/')
+        setattr(self.session, 'url', protocol.web_url(sub))
         setattr(self.session, 'token', token)
+        setattr(self.session, 'limiter', limiter)
+        setattr(self.session, 'cassette', cassette)
+        setattr(self.session, 'cache', cache)
+        setattr(self.session, 'health', health)
+        setattr(self.session, 'profiler', profiler)
+        setattr(self.session, 'traffic', traffic)
+        setattr(self.session, 'accept_encoding', accept_encoding)
+        setattr(self.session, 'executor', ThreadPoolExecutor(
+            concurrency, thread_name_prefix='characterai-http'
+        ))
 
         self.user = self.user(token, self.session)
         self.post = self.post(token, self.session)
         self.character = self.character(token, self.session)
         self.chat = self.chat(token, self.session)
-        self.chat2 = self.chat2(token, None, self.session)
+        self.chat2 = self.chat2(
+            token, None, self.session, context=context
+        )
 
     async def request(
         url: str, session: tls_client.Session,
         *, token: str = None, method: str = 'GET',
         data: dict = None, split: bool = False,
-        neo: bool = False
+        neo: bool = False, fields: list = None,
+        cached: bool = False
     ):
-        _log.debug(f"Making request to URL: {url} with method: {method}")
-        if neo:
-            link = f'https://neo.character.ai/{url}'
-        else:
-            link = f'{session.url}{url}'
+        return await PyAsyncCAI.send(
+            protocol.Request(
+                url, method=method, data=data,
+                split=split, neo=neo, cached=cached
+            ),
+            session, token=token, fields=fields
+        )
+
+    async def _call(session: tls_client.Session, fn, *args, **kwargs):
+        """Run a blocking tls_client call on the session's threads"""
+        executor = getattr(session, 'executor', None)
+        if executor == None:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def send(
+        request: protocol.Request, session: tls_client.Session,
+        *, token: str = None, fields: list = None,
+        use_cache: bool = True, validators: dict = None
+    ):
+        """Perform a request described by characterai.protocol
+
+        With validators, a dict kept between calls, the request is
+        conditional on the ETag and Last-Modified of the previous
+        response and returns None when the server answers 304. The
+        validators of a response are kept only once it checked out.
+        """
+        _log.debug(f"Making request to URL: {request.path} with method: {request.method}")
+        link = protocol.link(request, session.url)
 
         if token == None:
             key = session.token
         else:
             key = token
 
-        headers = {
-            'Authorization': f'Token {key}'
-        }
-
-        if method == 'GET':
-            response = session.get(
-                link, headers=headers
-            )
-
-        elif method == 'POST':
-            response = session.post(
-                link, headers=headers, json=data
+        headers = protocol.headers(
+            key, getattr(session, 'accept_encoding', None)
+        )
+        if validators != None:
+            protocol.conditional(headers, validators)
+            use_cache = False
+
+        cache = getattr(session, 'cache', None)
+        if use_cache and request.cached and cache != None and fields == None:
+            return await cache.afetch(
+                cache.key(request.method, link, request.data, key),
+                lambda: PyAsyncCAI.send(
+                    request, session, token=token, use_cache=False
+                )
             )
 
-        elif method == 'PUT':
-            response = session.put(
-                link, headers=headers, json=data
-            )
+        profiler = getattr(session, 'profiler', None)
+        span = profiler.span(request.path) if profiler != None else None
+
+        limiter = getattr(session, 'limiter', None)
+        if limiter != None:
+            await limiter.acquire()
+        start = time.monotonic()
+        dropped = True
+        failed = True
+        if span != None:
+            span.mark('queue')
+
+        cassette = getattr(session, 'cassette', None)
+
+        # cache and cassette keys keep the configured host, only the
+        # request itself goes to the host the prober picked
+        health = getattr(session, 'health', None)
+        host = None
+        target = link
+        if health != None and not request.neo:
+            if cassette == None or not cassette.replaying:
+                host = health.best()
+                target = f'{host}{request.path}'
+
+        method, data = request.method, request.data
+        response = None
+        try:
+            if cassette != None and cassette.replaying:
+                response = cassette.play(method, link, data)
+                if cassette.speed:
+                    await asyncio.sleep(response.elapsed / cassette.speed)
+
+            elif method == 'GET':
+                response = await PyAsyncCAI._call(
+                    session, session.get, target, headers=headers
+                )
 
-        _log.debug(f"Received response: {response}. Status code: {response.status_code}")
-        _log.debug(f"Response text: {response.text}")
+            elif method == 'POST':
+                response = await PyAsyncCAI._call(
+                    session, session.post, target, headers=headers, json=data
+                )
 
+            elif method == 'PUT':
+                response = await PyAsyncCAI._call(
+                    session, session.put, target, headers=headers, json=data
+                )
 
-        if split:
-            data = json.loads(response.text.split('\n')[-2])
-        else:
-            data = response.json()
+            if host != None:
+                health.observe(host, time.monotonic() - start, response)
+                host = None
+            if span != None:
+                span.mark('send')
 
-        if str(data).startswith("{'command': 'neo_error'"):
-            raise errors.ServerError(data['comment'])
-        elif str(data).startswith("{'detail': 'Auth"):
-            raise errors.AuthError('Invalid token')
-        elif str(data).startswith("{'status': 'Error"):
-            raise errors.ServerError(data['status'])
-        elif str(data).startswith("{'error'"):
-            raise errors.ServerError(data['error'])
-        else:
+            if cassette != None and not cassette.replaying:
+                cassette.record(
+                    method, link, data, response,
+                    time.monotonic() - start
+                )
+            traffic = getattr(session, 'traffic', None)
+            if traffic != None and (cassette == None or not cassette.replaying):
+                traffic.observe(request.path, data, response)
+
+            _log.debug(f"Received response: {response}. Status code: {response.status_code}")
+            _log.debug(f"Response text: {response.text}")
+            if span != None:
+                span.mark('log')
+
+            fresh = {}
+            if validators != None and protocol.validate(response, fresh):
+                validators.update(fresh)
+                dropped = False
+                failed = False
+                return None
+
+            data, projected = protocol.decode(request, response.text, fields)
+            if span != None:
+                span.mark('decode')
+            if not projected:
+                protocol.check(data)
+            if validators != None:
+                validators.update(fresh)
+
+            dropped = response.status_code == 429 or response.status_code >= 500
+            failed = False
             return data
+        finally:
+            if host != None:
+                health.observe(host, time.monotonic() - start, None)
+            if span != None:
+                span.mark('classify')
+                span.end(failed=failed)
+            if limiter != None:
+                limiter.release(time.monotonic() - start, dropped=dropped)
 
     async def ping(self):
         _log.debug("Pinging server")
-        return self.session.get(
-            'https://neo.character.ai/ping/'
-        ).json()
+        return self.session.get(protocol.PING_URL).json()
+
+    async def warmup(
+        self, *, token: str = None, websocket: bool = True,
+        interval: float = 30
+    ):
+        """Open connections before the first call needs them
+
+        Every host the client may use (its web host, the hosts of its
+        HealthProber and neo) is touched in parallel with validating
+        the token through user.info() and opening the chat2 websocket,
+        which the next connect() with the same token and compression
+        takes over. Every `interval` seconds the hosts are pinged again
+        so their connections do not idle out; cooldown() stops that.
+        Returns the seconds each host took to answer, or the exception
+        it failed with. A rejected token raises errors.AuthError.
+        """
+        _log.debug("Warming up connections")
+        key = self.token if token == None else token
+        hosts = self._hosts()
+        cassette = getattr(self.session, 'cassette', None)
+        if cassette != None and cassette.replaying:
+            hosts = []
+
+        async def validate():
+            return await PyAsyncCAI.send(
+                protocol.user_info(), self.session,
+                token=token, use_cache=False
+            )
+
+        async def ws():
+            if self._warm != None:
+                return
+            self._warm = (key, 'deflate', await self._open(key, 'deflate'))
+
+        jobs = [self._touch(host) for host in hosts] + [validate()]
+        if websocket:
+            jobs.append(ws())
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+
+        for result in results[len(hosts):]:
+            if isinstance(result, BaseException):
+                raise result
+
+        if interval and (self._keepalive == None or self._keepalive.done()):
+            self._keepalive = asyncio.ensure_future(self._ping_hosts(interval))
+        return dict(zip(hosts, results))
+
+    async def cooldown(self):
+        """Stop the idle pings and close a websocket nobody took over"""
+        if self._keepalive != None:
+            self._keepalive.cancel()
+            try:
+                await self._keepalive
+            except asyncio.CancelledError:
+                pass
+            self._keepalive = None
+        if self._warm != None:
+            ws = self._warm[2]
+            self._warm = None
+            await ws.close()
+
+    async def close(self):
+        """cooldown() and stop the threads running the HTTP calls"""
+        await self.cooldown()
+        executor = getattr(self.session, 'executor', None)
+        if executor != None:
+            executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    def _hosts(self):
+        hosts = [self.session.url]
+        health = getattr(self.session, 'health', None)
+        if health != None:
+            hosts += [host for host in health.hosts if host not in hosts]
+        return hosts + [protocol.NEO_URL]
+
+    async def _touch(self, host: str):
+        """Seconds a ping to host took, over a connection kept for later"""
+        start = time.monotonic()
+        response = await PyAsyncCAI._call(
+            self.session, self.session.get, f'{host}ping/'
+        )
+        latency = time.monotonic() - start
+        health = getattr(self.session, 'health', None)
+        if health != None:
+            health.observe(host, latency, response)
+        if response.status_code >= 500:
+            raise errors.ServerError(f'HTTP {response.status_code} from {host}')
+        return latency
+
+    async def _ping_hosts(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for host in self._hosts():
+                try:
+                    await self._touch(host)
+                except Exception as e:
+                    _log.debug(f"Idle ping to {host} failed: {e!r}")
+
+    async def _open(self, key: str, compression: str = 'deflate'):
+        cassette = getattr(self.session, 'cassette', None)
+        if cassette != None and cassette.replaying:
+            return cassette.websocket()
+        try:
+            ws = await websockets.connect(
+                protocol.WS_URL,
+                extra_headers={'Cookie': f'HTTP_AUTHORIZATION="Token {key}"'},
+                compression=compression
+            )
+        except websockets.exceptions.InvalidStatusCode:
+            raise errors.AuthError('Invalid token')
+
+        if cassette != None:
+            ws = cassette.websocket(ws)
+        return ws
 
     @asynccontextmanager
-    async def connect(self, token: str = None):
+    async def connect(
+        self, token: str = None, *,
+        maxsize: int = 64, policy: str = 'coalesce',
+        compression: str = 'deflate'
+    ):
+        """chat2 over one websocket, frames of each command buffered
+        up to `maxsize` with the overflow policy of BoundedBuffer.
+        compression=None turns permessage-deflate off"""
         _log.debug("Connecting to server")
+        self.router = None
+        self.ws = None
         try:
             if token == None: key = self.token
             else: key = token
 
             setattr(self.session, 'token', key)
 
-            try:
-                self.ws = await websockets.connect(
-                    'wss://neo.character.ai/ws/',
-                    extra_headers={'Cookie': f'HTTP_AUTHORIZATION="Token {key}"'}
-                )
-            except websockets.exceptions.InvalidStatusCode:
-                raise errors.AuthError('Invalid token')
-            
-            yield PyAsyncCAI.chat2(key, self.ws, self.session)
+            warm, self._warm = self._warm, None
+            if warm != None and warm[:2] == (key, compression) \
+                    and getattr(warm[2], 'open', True):
+                self.ws = warm[2]
+            else:
+                if warm != None:
+                    await warm[2].close()
+                self.ws = await self._open(key, compression)
+
+            self.router = FrameRouter(
+                self.ws, maxsize=maxsize, policy=policy,
+                traffic=getattr(self.session, 'traffic', None)
+            )
+            yield PyAsyncCAI.chat2(
+                key, self.ws, self.session,
+                router=self.router, context=self.context
+            )
         finally:
             _log.debug("Closing connection")
-            await self.ws.close()
+            if self.router != None:
+                await self.router.stop()
+            # None when opening the socket failed
+            if self.ws != None:
+                await self.ws.close()
 
     class user:
         """Responses from site for user info
@@ -133,10 +409,11 @@ class PyAsyncCAI:
             self.session = session
             _log.debug("User object initialized")
 
-        async def info(self, *, token: str = None):
+        async def info(self, *, token: str = None, fields: list = None):
             _log.debug("Getting user info")
-            return await PyAsyncCAI.request(
-                'chat/user/', self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.user_info(), self.session,
+                token=token, fields=fields
             )
 
         async def get_profile(
@@ -144,37 +421,33 @@ class PyAsyncCAI:
             token: str = None
         ):
             _log.debug(f"Getting profile for username: {username}")
-            return await PyAsyncCAI.request(
-                'chat/user/public/', self.session,
-                token=token, method='POST',
-                data={
-                    'username': username
-                }
+            return await PyAsyncCAI.send(
+                protocol.user_profile(username),
+                self.session, token=token
             )
 
         async def followers(self, *, token: str = None):
             _log.debug("Getting followers")
-            return await PyAsyncCAI.request(
-                'chat/user/followers/', self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.user_followers(), self.session, token=token
             )
 
         async def following(self, *, token: str = None):
             _log.debug("Getting following")
-            return await PyAsyncCAI.request(
-                'chat/user/following/', self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.user_following(), self.session, token=token
             )
         
         async def recent(self, *, token: str = None):
             _log.debug("Getting recent characters")
-            return await PyAsyncCAI.request(
-                'chat/characters/recent/', self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.user_recent(), self.session, token=token
             )
 
         async def characters(self, *, token: str = None):
             _log.debug("Getting characters")
-            return await PyAsyncCAI.request(
-                'chat/characters/?scope=user',
-                self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.user_characters(), self.session, token=token
             )
 
         async def update(
@@ -183,13 +456,9 @@ class PyAsyncCAI:
             **kwargs
         ):
             _log.debug(f"Updating user with username: {username}, additional data: {kwargs}")
-            return await PyAsyncCAI.request(
-                'chat/user/update/', self.session,
-                token=token, method='POST',
-                data={
-                    'username': username,
-                    **kwargs
-                }
+            return await PyAsyncCAI.send(
+                protocol.user_update(username, **kwargs),
+                self.session, token=token
             )
     class post:
         """Just a responses from site for posts
@@ -213,34 +482,32 @@ class PyAsyncCAI:
             _log.debug("Post object initialized")
 
         async def get_post(
-            self, post_id: str
+            self, post_id: str, *, fields: list = None
         ):
             _log.debug(f"Getting post with ID: {post_id}")
-            return await PyAsyncCAI.request(
-                f'chat/post/?post={post_id}',
-                self.session
+            return await PyAsyncCAI.send(
+                protocol.post_get(post_id),
+                self.session, fields=fields
             )
 
         async def my(
             self, *, posts_page: int = 1,
-            posts_to_load: int = 5, token: str = None
+            posts_to_load: int = 5, token: str = None, fields: list = None
         ):
             _log.debug(f"Getting my posts, page: {posts_page}, posts to load: {posts_to_load}")
-            return await PyAsyncCAI.request(
-                f'chat/posts/user/?scope=user&page={posts_page}'
-                f'&posts_to_load={posts_to_load}/',
-                self.session
+            return await PyAsyncCAI.send(
+                protocol.post_my(posts_page, posts_to_load),
+                self.session, fields=fields
             )
 
         async def get_posts(
             self, username: str, *,
-            posts_page: int = 1, posts_to_load: int = 5,
+            posts_page: int = 1, posts_to_load: int = 5, fields: list = None,
         ):
             _log.debug(f"Getting posts for username: {username}, page: {posts_page}, posts to load: {posts_to_load}")
-            return await PyAsyncCAI.request(
-                f'chat/posts/user/?username={username}'
-                f'&page={posts_page}&posts_to_load={posts_to_load}/',
-                self.session
+            return await PyAsyncCAI.send(
+                protocol.post_list(username, posts_page, posts_to_load),
+                self.session, fields=fields
             )
 
         async def upvote(
@@ -248,12 +515,9 @@ class PyAsyncCAI:
             *, token: str = None
         ):
             _log.debug(f"Upvoting post with external ID: {post_external_id}")
-            return await PyAsyncCAI.request(
-                'chat/post/upvote/', self.session,
-                token=token, method='POST',
-                data={
-                    'post_external_id': post_external_id
-                }
+            return await PyAsyncCAI.send(
+                protocol.post_upvote(post_external_id),
+                self.session, token=token
             )
 
         async def undo_upvote(
@@ -261,12 +525,9 @@ class PyAsyncCAI:
             *, token: str = None
         ):
             _log.debug(f"Undoing upvote for post with external ID: {post_external_id}")
-            return await PyAsyncCAI.request(
-                'chat/post/undo-upvote/', self.session,
-                token=token, method='POST',
-                data={
-                    'post_external_id': post_external_id
-                }
+            return await PyAsyncCAI.send(
+                protocol.post_undo_upvote(post_external_id),
+                self.session, token=token
             )
 
         async def send_comment(
@@ -274,14 +535,9 @@ class PyAsyncCAI:
             parent_uuid: str = None, token: str = None
         ):
             _log.debug(f"Sending comment to post with ID: {post_id}, text: {text}, parent UUID: {parent_uuid}")
-            return await PyAsyncCAI.request(
-                'chat/comment/create/', self.session,
-                token=token, method='POST',
-                data={
-                    'post_external_id': post_id,
-                    'text': text,
-                    'parent_uuid': parent_uuid
-                }
+            return await PyAsyncCAI.send(
+                protocol.post_comment(post_id, text, parent_uuid),
+                self.session, token=token
             )
 
         async def delete_comment(
@@ -289,13 +545,9 @@ class PyAsyncCAI:
             *, token: str = None
         ):
             _log.debug(f"Deleting comment with message ID: {message_id} from post with ID: {post_id}")
-            return await PyAsyncCAI.request(
-                'chat/comment/delete/', self.session,
-                token=token, method='POST',
-                data={
-                    'external_id': message_id,
-                    'post_external_id': post_id
-                }
+            return await PyAsyncCAI.send(
+                protocol.post_delete_comment(message_id, post_id),
+                self.session, token=token
             )
 
         async def create(
@@ -305,28 +557,12 @@ class PyAsyncCAI:
             token: str = None, **kwargs
         ):
             _log.debug(f"Creating post with type: {post_type}, external ID: {external_id}, title: {title}, text: {text}, visibility: {post_visibility}, additional data: {kwargs}")
-            if post_type == 'POST':
-                post_link = 'chat/post/create/'
-                data = {
-                    'post_title': title,
-                    'topic_external_id': external_id,
-                    'post_text': text,
-                    **kwargs
-                }
-            elif post_type == 'CHAT':
-                post_link = 'chat/chat-post/create/'
-                data = {
-                    'post_title': title,
-                    'subject_external_id': external_id,
-                    'post_visibility': post_visibility,
-                    **kwargs
-                }
-            else:
-                raise errors.PostTypeError('Invalid post_type')
-
-            return await PyAsyncCAI.request(
-                post_link, self.session,
-                token=token, method='POST'
+            return await PyAsyncCAI.send(
+                protocol.post_create(
+                    post_type, external_id, title,
+                    text, post_visibility, **kwargs
+                ),
+                self.session, token=token
             )
 
         async def delete(
@@ -334,30 +570,26 @@ class PyAsyncCAI:
             token: str = None
         ):
             _log.debug(f"Deleting post with ID: {post_id}")
-            return await PyAsyncCAI.request(
-                'chat/post/delete/', self.session,
-                token=token, method='POST',
-                data={
-                    'external_id': post_id
-                }
+            return await PyAsyncCAI.send(
+                protocol.post_delete(post_id),
+                self.session, token=token
             )
 
         async def get_topics(self):
             _log.debug("Getting topics")
-            return await PyAsyncCAI.request(
-                'chat/topics/', self.session
+            return await PyAsyncCAI.send(
+                protocol.post_topics(), self.session
             )
 
         async def feed(
             self, topic: str, num: int = 1, 
             load: int = 5, sort: str = 'top', *,
-            token: str = None
+            token: str = None, fields: list = None
         ):
             _log.debug(f"Getting feed for topic: {topic}, page: {num}, posts to load: {load}, sort: {sort}")
-            return await PyAsyncCAI.request(
-                f'chat/posts/?topic={topic}&page={num}'
-                f'&posts_to_load={load}&sort={sort}',
-                self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.post_feed(topic, num, load, sort),
+                self.session, token=token, fields=fields
             )
 
     class character:
@@ -391,24 +623,21 @@ class PyAsyncCAI:
             token: str = None, **kwargs
         ):
             _log.debug(f"Creating character with greeting: {greeting}, identifier: {identifier}, name: {name}, title: {title}, visibility: {visibility}, additional data: {kwargs}")
-            return await PyAsyncCAI.request(
-                '../chat/character/create/', self.session,
-                token=token, method='POST',
-                data={
-                    'greeting': greeting,
-                    'identifier': identifier,
-                    'name': name,
-                    'avatar_rel_path': avatar_rel_path,
-                    'base_img_prompt': base_img_prompt,
-                    'categories': categories,
-                    'copyable': copyable,
-                    'definition': definition,
-                    'description': description,
-                    'img_gen_enabled': img_gen_enabled,
-                    'title': title,
-                    'visibility': visibility,
+            return await PyAsyncCAI.send(
+                protocol.character_create(
+                    greeting, identifier, name,
+                    avatar_rel_path=avatar_rel_path,
+                    base_img_prompt=base_img_prompt,
+                    categories=categories,
+                    copyable=copyable,
+                    definition=definition,
+                    description=description,
+                    title=title,
+                    img_gen_enabled=img_gen_enabled,
+                    visibility=visibility,
                     **kwargs
-                }
+                ),
+                self.session, token=token
             )
 
         async def update(
@@ -420,74 +649,61 @@ class PyAsyncCAI:
             token: str = None, **kwargs
         ):
             _log.debug(f"Updating character with external ID: {external_id}, greeting: {greeting}, identifier: {identifier}, name: {name}, title: {title}, visibility: {visibility}, additional data: {kwargs}")
-            return await PyAsyncCAI.request(
-                '../chat/character/update/', self.session,
-                token=token, method='POST',
-                data={
-                    'external_id': external_id,
-                    'name': name,
-                    'categories': categories,
-                    'title': title,
-                    'visibility': visibility,
-                    'copyable': copyable,
-                    'description': description,
-                    'greeting': greeting,
-                    'definition': definition,
-                    **kwargs
-                }
+            return await PyAsyncCAI.send(
+                protocol.character_update(
+                    external_id, greeting, identifier, name,
+                    title, categories, definition, copyable,
+                    description, visibility, **kwargs
+                ),
+                self.session, token=token
             )
 
-        async def trending(self):
+        async def trending(self, *, fields: list = None):
             _log.debug("Getting trending characters")
-            return await PyAsyncCAI.request(
-                'chat/characters/trending/',
-                self.session
+            return await PyAsyncCAI.send(
+                protocol.character_trending(),
+                self.session, fields=fields
             )
 
         async def recommended(
-            self, *, token: str = None
+            self, *, token: str = None, fields: list = None
         ):
             _log.debug("Getting recommended characters")
-            return await PyAsyncCAI.request(
-                'chat/characters/recommended/',
-                self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.character_recommended(),
+                self.session, token=token, fields=fields
             )
 
         async def categories(self):
             _log.debug("Getting character categories")
-            return await PyAsyncCAI.request(
-                'chat/character/categories/',
-                self.session
+            return await PyAsyncCAI.send(
+                protocol.character_categories(), self.session
             )
 
         async def info(
             self, char: str, *,
-            token: str = None,
+            token: str = None, fields: list = None,
         ):
             _log.debug(f"Getting info for character: {char}")
-            return await PyAsyncCAI.request(
-                'chat/character/', self.session,
-                token=token, method='POST',
-                data={
-                    'external_id': char
-                }
+            return await PyAsyncCAI.send(
+                protocol.character_info(char), self.session,
+                token=token, fields=fields
             )
 
         async def search(
             self, query: str, *,
-            token: str = None
+            token: str = None, fields: list = None
         ):
             _log.debug(f"Searching characters with query: {query}")
-            return await PyAsyncCAI.request(
-                f'chat/characters/search/?query={query}/',
-                self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.character_search(query),
+                self.session, token=token, fields=fields
             )
 
         async def voices(self):
             _log.debug("Getting character voices")
-            return await PyAsyncCAI.request(
-                'chat/character/voices/',
-                self.session
+            return await PyAsyncCAI.send(
+                protocol.character_voices(), self.session
             )
 
     class chat:
@@ -517,16 +733,9 @@ class PyAsyncCAI:
             **kwargs
         ):
             _log.debug(f"Creating room with characters: {characters}, name: {name}, topic: {topic}, additional data: {kwargs}")
-            return await PyAsyncCAI.request(
-                '../chat/room/create/', self.session,
-                token=token, method='POST',
-                data={
-                    'characters': characters,
-                    'name': name,
-                    'topic': topic,
-                    'visibility': 'PRIVATE',
-                    **kwargs
-                }
+            return await PyAsyncCAI.send(
+                protocol.chat_create_room(characters, name, topic, **kwargs),
+                self.session, token=token
             )
 
         async def rate(
@@ -535,88 +744,61 @@ class PyAsyncCAI:
             **kwargs
         ):
             _log.debug(f"Rating with rate: {rate}, history_id: {history_id}, message_id: {message_id}, additional data: {kwargs}")
-            if rate == 0: label = [234, 238, 241, 244] #Terrible
-            elif rate == 1: label = [235, 237, 241, 244] #Bad
-            elif rate == 2: label = [235, 238, 240, 244] #Good
-            elif rate == 3: label = [235, 238, 241, 243] #Fantastic
-            else: raise errors.LabelError('Wrong Rate Value')
-
-            return await PyAsyncCAI.request(
-                'chat/annotations/label/', self.session,
-                token=token, method='PUT',
-                data={
-                    'label_ids': label,
-                    'history_external_id': history_id,
-                    'message_uuid': message_id,
-                    **kwargs
-                }
+            return await PyAsyncCAI.send(
+                protocol.chat_rate(rate, history_id, message_id, **kwargs),
+                self.session, token=token
             )
 
         async def next_message(
             self, history_id: str, parent_msg_uuid: str,
-            tgt: str, *, token: str = None, **kwargs
+            tgt: str, *, token: str = None, fields: list = None, **kwargs
         ):
             _log.debug(f"Getting next message for history_id: {history_id}, parent_msg_uuid: {parent_msg_uuid}, tgt: {tgt}, additional data: {kwargs}")
-            response = await PyAsyncCAI.request(
-                'chat/streaming/', self.session,
-                token=token, method='POST', split=True,
-                data={
-                    'history_external_id': history_id,
-                    'parent_msg_uuid': parent_msg_uuid,
-                    'tgt': tgt,
-                    **kwargs
-                }
+            return await PyAsyncCAI.send(
+                protocol.chat_next_message(
+                    history_id, parent_msg_uuid, tgt, **kwargs
+                ),
+                self.session, token=token, fields=fields
             )
 
         async def get_histories(
             self, char: str, *, number: int = 50,
-            token: str = None
+            token: str = None, fields: list = None
         ):
             _log.debug(f"Getting histories for character: {char}, number: {number}")
-            return await PyAsyncCAI.request(
-                'chat/character/histories_v2/', self.session,
-                token=token, method='POST',
-                data={'external_id': char, 'number': number},
+            return await PyAsyncCAI.send(
+                protocol.chat_histories(char, number),
+                self.session, token=token, fields=fields
             )
 
         async def get_history(
             self, history_id: str = None,
-            *, token: str = None
+            *, token: str = None, fields: list = None
         ):
             _log.debug(f"Getting history for history_id: {history_id}")
-            return await PyAsyncCAI.request(
-                'chat/history/msgs/user/?'
-                f'history_external_id={history_id}',
-                self.session, token=token
+            return await PyAsyncCAI.send(
+                protocol.chat_history(history_id),
+                self.session, token=token, fields=fields
             )
 
         async def get_chat(
             self, char: str = None, *,
-            token: str = None
+            token: str = None, fields: list = None
         ):
             _log.debug(f"Getting chat for character: {char}")
-            return await PyAsyncCAI.request(
-                'chat/history/continue/', self.session,
-                token=token, method='POST',
-                data={
-                    'character_external_id': char
-                }
+            return await PyAsyncCAI.send(
+                protocol.chat_continue(char),
+                self.session, token=token, fields=fields
             )
 
         async def send_message(
             self, history_id: str, tgt: str, text: str,
-            *, token: str = None, **kwargs
+            *, token: str = None, fields: list = None, **kwargs
         ):
             _log.debug(f"Sending message with history_id: {history_id}, tgt: {tgt}, text: {text}, additional data: {kwargs}")
-            return await PyAsyncCAI.request(
-                'chat/streaming/', self.session,
-                token=token, method='POST', split=True,
-                data={
-                    'history_external_id': history_id,
-                    'tgt': tgt,
-                    'text': text,
-                    **kwargs
-                }
+            return await PyAsyncCAI.send(
+                protocol.chat_send_message(history_id, tgt, text, **kwargs),
+                self.session, token=token, fields=fields
             )
 
         async def delete_message(
@@ -624,25 +806,18 @@ class PyAsyncCAI:
             *, token: str = None, **kwargs
         ):
             _log.debug(f"Deleting message with history_id: {history_id}, uuids_to_delete: {uuids_to_delete}, additional data: {kwargs}")
-            return await PyAsyncCAI.request(
-                'chat/history/msgs/delete/', self.session,
-                token=token, method='POST',
-                data={
-                    'history_id': history_id,
-                    'uuids_to_delete': uuids_to_delete,
-                    **kwargs
-                }
+            return await PyAsyncCAI.send(
+                protocol.chat_delete_message(
+                    history_id, uuids_to_delete, **kwargs
+                ),
+                self.session, token=token
             )
         async def new_chat(
             self, char: str, *, token: str = None
         ):
             _log.debug(f"Creating new chat for character: {char}")
-            return await PyAsyncCAI.request(
-                'chat/history/create/', self.session,
-                token=token, method='POST',
-                data={
-                    'character_external_id': char
-                }
+            return await PyAsyncCAI.send(
+                protocol.chat_new(char), self.session, token=token
             )
 
     class chat2:
@@ -650,6 +825,8 @@ class PyAsyncCAI:
 
         chat.next_message('CHAR', 'CHAT_ID', 'PARENT_ID')
         chat.send_message('CHAR', 'CHAT_ID', 'TEXT', {AUTHOR})
+        chat.stream_message('CHAR', 'CHAT_ID', 'TEXT', {AUTHOR})
+        chat.stream_next_message('CHAR', 'CHAT_ID', 'PARENT_ID')
         chat.next_message('CHAR', 'MESSAGE')
         chat.new_chat('CHAR', 'CHAT_ID', 'CREATOR_ID')
         chat.get_histories('CHAR')
@@ -657,156 +834,324 @@ class PyAsyncCAI:
         chat.get_history('CHAT_ID')
         chat.rate(RATE, 'CHAT_ID', 'TURN_ID', 'CANDIDATE_ID')
         chat.delete_message('CHAT_ID', 'TURN_ID')
+        chat.bulk_delete([('CHAT_ID', ['TURN_ID'])])
+        chat.subscribe(character_id='CHAR')
+        chat.on_turn(HANDLER, chat_id='CHAT_ID')
+
+        Commands accept timeout=SECONDS, a deadline for the whole call
+        that raises errors.TimeoutError, and abort=True, which sends
+        an abort_generation command when the call times out or is
+        cancelled. The server's support for that command is not
+        documented, so it is opt-in; either way the reply frames left
+        are dropped unread.
 
         """
         def __init__(
             self, token: str,
             ws: websockets.WebSocketClientProtocol,
-            session: tls_client.Session
+            session: tls_client.Session,
+            *, router: FrameRouter = None,
+            context: ContextTracker = None
         ):
             self.token = token
             self.session = session
             self.ws = ws
+            self.context = context
+            if router == None and ws != None:
+                router = FrameRouter(ws)
+            self.router = router
+            self._aborts = set()
+
+        def subscribe(
+            self, *, chat_id: str = None,
+            character_id: str = None, final: bool = False,
+            maxsize: int = 100, policy: str = 'drop'
+        ):
+            """Async iterator over the turn frames of matching chats
+
+            Every turn read from the socket is seen, including replies
+            to other callers' commands. final=True skips the partial
+            frames of a streamed turn. policy is 'drop', 'coalesce' or
+            'block' for a subscriber that falls `maxsize` frames behind.
+            """
+            _log.debug(f"Subscribing to turns of chat: {chat_id}, character: {character_id}")
+            return self.router.subscribe(
+                chat_id=chat_id, character_id=character_id,
+                final=final, maxsize=maxsize, policy=policy
+            )
+
+        def on_turn(
+            self, handler, *, chat_id: str = None,
+            character_id: str = None, final: bool = False,
+            maxsize: int = 100, policy: str = 'drop'
+        ):
+            """Await handler(frame) for each matching turn, close() the result to stop"""
+            _log.debug(f"Registering turn handler for chat: {chat_id}, character: {character_id}")
+            return self.router.subscribe(
+                chat_id=chat_id, character_id=character_id,
+                final=final, handler=handler,
+                maxsize=maxsize, policy=policy
+            )
+
+        async def _command(
+            self, message: dict, chat_id: str,
+            timeout: float = None
+        ):
+            """Send a command and return the channel its replies arrive on"""
+            deadline = None
+            if timeout != None:
+                deadline = time.monotonic() + timeout
+
+            profiler = getattr(self.session, 'profiler', None)
+            if profiler != None:
+                span = profiler.span(f"ws/{message['command']}")
+
+            limiter = getattr(self.session, 'limiter', None)
+            if limiter != None and deadline != None:
+                try:
+                    await asyncio.wait_for(limiter.acquire(), timeout)
+                except asyncio.TimeoutError:
+                    raise errors.TimeoutError(
+                        'No free slot before the deadline'
+                    ) from None
+            elif limiter != None:
+                await limiter.acquire()
+            payload = message.get('payload') or {}
+            character_id = payload.get('character_id') or (
+                payload.get('chat') or {}
+            ).get('character_id')
+            try:
+                channel = self.router.open(
+                    chat_id=chat_id, character_id=character_id
+                )
+            except:
+                if limiter != None:
+                    limiter.release(dropped=True)
+                raise
+            if profiler != None:
+                span.mark('queue')
+                channel.span = span
+            if limiter != None:
+                channel.on_close = lambda channel, failed: limiter.release(
+                    channel.latency, dropped=failed
+                )
+
+            channel.deadline = deadline
+            channel.command = message['command']
+            message['request_id'] = channel.request_id
+            frame = json.dumps(message)
+            traffic = getattr(self.session, 'traffic', None)
+            if traffic != None:
+                traffic.frame(f"ws/{channel.command}", len(frame), sent=True)
+            try:
+                await self.ws.send(frame)
+            except:
+                channel.close(failed=True)
+                raise
+            if channel.span != None:
+                channel.span.mark('send')
+            return channel
+
+        @contextmanager
+        def _guard(self, channel, abort: bool = False):
+            """Close the channel, aborting the generation if left early"""
+            with channel:
+                try:
+                    yield channel
+                except (
+                    asyncio.CancelledError, GeneratorExit,
+                    errors.TimeoutError
+                ):
+                    if abort:
+                        self._abort(channel)
+                    raise
+
+        def _abort(self, channel):
+            _log.debug(f"Aborting generation for request: {channel.request_id}")
+            task = asyncio.ensure_future(self.ws.send(json.dumps(
+                protocol.abort_command(channel.request_id, channel.chat_id)
+            )))
+            # the caller is being cancelled and cannot wait for the send
+            self._aborts.add(task)
+            task.add_done_callback(self._aborted)
+
+        def _aborted(self, task):
+            self._aborts.discard(task)
+            if not task.cancelled() and task.exception() != None:
+                _log.debug(f"Abort command failed: {task.exception()!r}")
+
+        async def _turns(self, channel):
+            """Character turn frames of the channel, other frames are not decoded"""
+            span = channel.span
+            first = True
+            while True:
+                raw = await channel.recv()
+                if span != None:
+                    span.mark('first_frame' if first else 'recv')
+                    first = False
+                if streaming.is_foreign_frame(raw, channel.chat_id):
+                    # the echo of our own turn is only worth decoding for context
+                    if self.context == None or streaming.frame_chat_id(raw) != channel.chat_id:
+                        continue
+
+                response = protocol.turn_frame(raw)
+                if span != None:
+                    span.mark('decode')
+
+                if self.context != None:
+                    self.context.record(response['turn'])
+
+                if protocol.is_character_turn(response):
+                    if span != None:
+                        span.mark('classify')
+                    yield response
+                    if span != None:
+                        span.mark('callback')
+
+        async def _final_turn(self, channel):
+            async for response in self._turns(channel):
+                if protocol.is_final_turn(response):
+                    return response
+
+        async def _stream_turn(self, channel, abort: bool = False):
+            stream = streaming.TurnStream()
+            with self._guard(channel, abort):
+                async for response in self._turns(channel):
+                    for delta in stream.feed(response['turn']):
+                        yield delta
+                    if stream.is_final:
+                        return
 
         async def next_message(
             self, char: str, chat_id: str,
-            parent_msg_uuid: str
+            parent_msg_uuid: str, *,
+            timeout: float = None, abort: bool = False
         ):
             _log.debug(f"Sending next message request for character: {char}, chat_id: {chat_id}, parent_msg_uuid: {parent_msg_uuid}")
-            await self.ws.send(json.dumps({
-                'command': 'generate_turn_candidate',
-                'payload': {
-                    'character_id': char,
-                    'turn_key': {
-                        'turn_id': parent_msg_uuid,
-                        'chat_id': chat_id
-                    }
-                }
-            }))
+            channel = await self._command(
+                protocol.next_message_command(char, chat_id, parent_msg_uuid),
+                chat_id, timeout
+            )
+            with self._guard(channel, abort):
+                response = await self._final_turn(channel)
+            _log.debug(f"Received next message response: {response}")
+            return response
 
-            while True:
-                response = json.loads(await self.ws.recv())
-                try: response['turn']
-                except: raise errors.ServerError(response['comment'])
-                
-                if not response['turn']['author']['author_id'].isdigit():
-                    try: is_final = response['turn']['candidates'][0]['is_final']
-                    except: pass
-                    else:
-                        _log.debug(f"Received next message response: {response}")
-                        return response
+        async def stream_next_message(
+            self, char: str, chat_id: str,
+            parent_msg_uuid: str, *,
+            timeout: float = None, abort: bool = False
+        ):
+            _log.debug(f"Streaming next message for character: {char}, chat_id: {chat_id}, parent_msg_uuid: {parent_msg_uuid}")
+            channel = await self._command(
+                protocol.next_message_command(char, chat_id, parent_msg_uuid),
+                chat_id, timeout
+            )
+            deltas = self._stream_turn(channel, abort)
+            try:
+                async for delta in deltas:
+                    yield delta
+            finally:
+                await deltas.aclose()
 
         async def send_message(
             self, char: str, chat_id: str,
             text: str, author: dict = None,
             *, turn_id: str = None, custom_id: str = None,
-            candidate_id: str = None
+            candidate_id: str = None,
+            timeout: float = None, abort: bool = False
         ):  
             _log.debug(f"Sending message for character: {char}, chat_id: {chat_id}, text: {text}")
-            
-            if custom_id != None:
-                turn_key = {
-                    'turn_id': custom_id,
-                    'chat_id': chat_id
-                }
-            else:
-                turn_key = {'chat_id': chat_id}
-            
-            message = {
-                'command': 'create_and_generate_turn',
-                'payload': {
-                    'character_id': char,
-                    'turn': {
-                        'turn_key': turn_key,
-                        'author': author,
-                        'candidates': [{'raw_content': text}]
-                    }
-                }
-            }
-
-            if turn_id != None and candidate_id != None:
-                message['update_primary_candidate'] = {
-                    'candidate_id': candidate_id,
-                    'turn_key': {
-                        'turn_id': turn_id,
-                        'chat_id': chat_id
-                    }
-                }
-        
-            await self.ws.send(json.dumps(message))
+            message = protocol.send_message_command(
+                char, chat_id, text, author, turn_id,
+                custom_id, candidate_id
+            )
+            if self.context != None and custom_id != None:
+                self.context.record(message['payload']['turn'])
 
-            while True:
-                response = json.loads(await self.ws.recv())
-
-                try: response['turn']
-                except: raise errors.ServerError(response['comment'])
-                
-                if not response['turn']['author']['author_id'].isdigit():
-                    try: is_final = response['turn']['candidates'][0]['is_final']
-                    except: pass
-                    else: 
-                        _log.debug(f"Received message response: {response}")
-                        return response
+            channel = await self._command(message, chat_id, timeout)
+            with self._guard(channel, abort):
+                response = await self._final_turn(channel)
+            _log.debug(f"Received message response: {response}")
+            return response
+
+        async def stream_message(
+            self, char: str, chat_id: str,
+            text: str, author: dict = None,
+            *, turn_id: str = None, custom_id: str = None,
+            candidate_id: str = None,
+            timeout: float = None, abort: bool = False
+        ):
+            _log.debug(f"Streaming message for character: {char}, chat_id: {chat_id}, text: {text}")
+            message = protocol.send_message_command(
+                char, chat_id, text, author, turn_id,
+                custom_id, candidate_id
+            )
+            if self.context != None and custom_id != None:
+                self.context.record(message['payload']['turn'])
+
+            channel = await self._command(message, chat_id, timeout)
+            deltas = self._stream_turn(channel, abort)
+            try:
+                async for delta in deltas:
+                    yield delta
+            finally:
+                await deltas.aclose()
 
         async def new_chat(
             self, char: str, chat_id: str,
-            creator_id: str, *, with_greeting: bool = True
+            creator_id: str, *, with_greeting: bool = True,
+            timeout: float = None
         ):
             _log.debug(f"Creating new chat for character: {char}, chat_id: {chat_id}, creator_id: {creator_id}")
             
-            await self.ws.send(json.dumps({
-                'command': 'create_chat',
-                'payload': {
-                    'chat': {
-                        'chat_id': chat_id,
-                        'creator_id': creator_id,
-                        'visibility': 'VISIBILITY_PRIVATE',
-                        'character_id': char,
-                        'type': 'TYPE_ONE_ON_ONE'
-                    },
-                    'with_greeting': with_greeting
-                }
-            }))
-
-            response = json.loads(await self.ws.recv())
-            try: response['chat']
-            except KeyError:
-                raise errors.ServerError(response['comment'])
-            else:
-                answer = json.loads(await self.ws.recv())
+            channel = await self._command(
+                protocol.create_chat_command(
+                    char, chat_id, creator_id, with_greeting
+                ),
+                chat_id, timeout
+            )
+
+            with channel:
+                response = protocol.chat_frame(await channel.recv())
+                answer = protocol.load_frame(await channel.recv())
+                if self.context != None and 'turn' in answer:
+                    self.context.record(answer['turn'])
                 _log.debug(f"Received new chat response: {response}, answer: {answer}")
                 return response, answer
 
         async def get_histories(
             self, char: str = None, *,
-            preview: int = 2, token: str = None
+            preview: int = 2, token: str = None, fields: list = None
         ):
             _log.debug(f"Getting histories for character: {char}, preview: {preview}")
-            return await PyAsyncCAI.request(
-                f'chats/?character_ids={char}'
-                f'&num_preview_turns={preview}',
-                self.session, token=token, neo=True
+            return await PyAsyncCAI.send(
+                protocol.chat2_histories(char, preview),
+                self.session, token=token, fields=fields
             )
 
         async def get_chat(
             self, char: str = None, *,
-            token: str = None
+            token: str = None, fields: list = None
         ):
             _log.debug(f"Getting chat for character: {char}")
-            return await PyAsyncCAI.request(
-                f'chats/recent/{char}',
-                self.session, token=token, neo=True
+            return await PyAsyncCAI.send(
+                protocol.chat2_recent(char),
+                self.session, token=token, fields=fields
             )
 
         async def get_history(
             self, chat_id: str = None, *,
-            token: str = None
+            token: str = None, fields: list = None
         ):
             _log.debug(f"Getting history for chat_id: {chat_id}")
-            return await PyAsyncCAI.request(
-                f'turns/{chat_id}/', self.session,
-                token=token, neo=True
+            response = await PyAsyncCAI.send(
+                protocol.chat2_turns(chat_id),
+                self.session, token=token, fields=fields
             )
+            if self.context != None and fields == None:
+                self.context.record_history(response)
+            return response
 
         async def rate(
             self, rate: int, chat_id: str,
@@ -814,34 +1159,107 @@ class PyAsyncCAI:
             *, token: str = None
         ):
             _log.debug(f"Rating chat: {chat_id}, turn: {turn_id}, candidate: {candidate_id} with rate: {rate}")
-            return await PyAsyncCAI.request(
-                'annotation/create', self.session,
-                token=token, method='POST', neo=True,
-                data={
-                    'turn_key': {
-                        'chat_id': chat_id,
-                        'turn_id': turn_id
-                    },
-                    'candidate_id': candidate_id,
-                    'annotation': {
-                        'annotation_type': 'star',
-                        'annotation_value': rate
-                    }
-                }
+            return await PyAsyncCAI.send(
+                protocol.chat2_rate(rate, chat_id, turn_id, candidate_id),
+                self.session, token=token
             )
 
         async def delete_message(
             self, chat_id: str, turn_ids: list,
-            *, token: str = None, **kwargs
+            *, token: str = None, timeout: float = None,
+            **kwargs
         ):
             _log.debug(f"Deleting messages in chat: {chat_id}, turns: {turn_ids}")
-            await self.ws.send(json.dumps({
-                'command':'remove_turns',
-                'payload': {
-                    'chat_id': chat_id,
-                    'turn_ids': turn_ids
-                }
-            }))
-            res = await self.ws.recv()
+            channel = await self._command(
+                protocol.remove_turns_command(chat_id, turn_ids),
+                chat_id, timeout
+            )
+            with channel:
+                res = await channel.recv()
             _log.debug(f"Received delete message response: {res}")
-            return json.loads(res)
+            if self.context != None:
+                self.context.remove_turns(chat_id, turn_ids)
+            return protocol.load_frame(res)
+
+        async def bulk_delete(
+            self, pairs, *, window: int = 64,
+            batch: int = 1000, max_turns: int = 500
+        ):
+            """Delete turns of many chats, yielding (chat_id, turn_ids, result)
+
+            pairs is an iterable or async iterable of (chat_id, turn_ids).
+            Turn ids are merged per chat within each batch of pairs and up
+            to `window` remove_turns commands are kept in flight on the
+            socket. result is the server reply, or the exception raised
+            for that chat.
+            """
+            _log.debug(f"Bulk deleting turns, window: {window}")
+            results = asyncio.Queue()
+            slots = asyncio.Semaphore(window)
+            done = object()
+
+            async def remove(chat_id, turn_ids):
+                try:
+                    channel = await self._command(
+                        protocol.remove_turns_command(chat_id, turn_ids),
+                        chat_id
+                    )
+                    with channel:
+                        response = protocol.command_reply(await channel.recv())
+                    if self.context != None:
+                        self.context.remove_turns(chat_id, turn_ids)
+                except Exception as e:
+                    response = e
+                finally:
+                    slots.release()
+                await results.put((chat_id, turn_ids, response))
+
+            async def flush(merged):
+                for chat_id, turn_ids in merged.items():
+                    turn_ids = list(turn_ids)
+                    for start in range(0, len(turn_ids), max_turns):
+                        await slots.acquire()
+                        task = asyncio.ensure_future(
+                            remove(chat_id, turn_ids[start:start + max_turns])
+                        )
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                merged.clear()
+
+            async def produce():
+                merged = {}
+                count = 0
+
+                async def add(chat_id, turn_ids):
+                    nonlocal count
+                    merged.setdefault(chat_id, {}).update(dict.fromkeys(turn_ids))
+                    count += 1
+                    if count % batch == 0:
+                        await flush(merged)
+
+                try:
+                    if hasattr(pairs, '__aiter__'):
+                        async for chat_id, turn_ids in pairs:
+                            await add(chat_id, turn_ids)
+                    else:
+                        for chat_id, turn_ids in pairs:
+                            await add(chat_id, turn_ids)
+                    await flush(merged)
+                    if tasks:
+                        await asyncio.wait(tasks)
+                finally:
+                    await results.put(done)
+
+            tasks = set()
+            producer = asyncio.ensure_future(produce())
+            try:
+                while True:
+                    item = await results.get()
+                    if item is done:
+                        break
+                    yield item
+                await producer
+            finally:
+                producer.cancel()
+                for task in tasks:
+                    task.cancel()
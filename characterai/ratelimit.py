@@ -0,0 +1,263 @@
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import multiprocessing
+import time
+
+from characterai import errors
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["RateLimiter", "SharedRateLimiter", "CircuitBreaker", "AdaptiveLimiter"]
+
+
+class RateLimiter:
+    """Token bucket for one event loop
+
+    limiter = RateLimiter(10, burst=20)
+    async with limiter:
+        ...
+
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = None
+
+    def _take(self, amount: float = 1):
+        """Take tokens if available, otherwise return the seconds to wait"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        if self._tokens >= amount:
+            self._tokens -= amount
+            return 0
+        return (amount - self._tokens) / self.rate
+
+    async def acquire(self, amount: float = 1):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                wait = self._take(amount)
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class SharedRateLimiter(RateLimiter):
+    """Token bucket shared by every process it is handed to
+
+    The bucket lives in shared memory, so it has to be created before
+    the worker processes and passed to them as an argument.
+
+    """
+
+    def __init__(self, rate: float, burst: float = None, *, context=None):
+        context = context or multiprocessing.get_context()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._state = context.Array("d", [self.burst, time.monotonic()], lock=False)
+        self._shared_lock = context.Lock()
+        self._lock = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        return state
+
+    def _take(self, amount: float = 1):
+        with self._shared_lock:
+            now = time.monotonic()
+            tokens, stamp = self._state[0], self._state[1]
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            self._state[1] = now
+            if tokens >= amount:
+                self._state[0] = tokens - amount
+                return 0
+            self._state[0] = tokens
+            return (amount - tokens) / self.rate
+
+
+class CircuitBreaker:
+    """Failure counter that opens after too many consecutive errors
+
+    While open every call is refused with CircuitOpenError until
+    reset_timeout has passed, then a single trial call is let through.
+    State is kept in shared memory so all worker processes agree.
+
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        *,
+        context=None,
+    ):
+        context = context or multiprocessing.get_context()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # failures, opened_at (0 while closed)
+        self._state = context.Array("d", [0, 0], lock=False)
+        self._lock = context.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            opened_at = self._state[1]
+        if not opened_at:
+            return "closed"
+        if time.monotonic() - opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def check(self):
+        with self._lock:
+            opened_at = self._state[1]
+            if not opened_at:
+                return
+            if time.monotonic() - opened_at < self.reset_timeout:
+                raise errors.CircuitOpenError("Circuit is open")
+            # let one trial call through; restarting the timeout refuses
+            # the next ones with CircuitOpenError until it succeeds
+            self._state[1] = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self._state[0] = 0
+            self._state[1] = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._state[0] += 1
+            if self._state[0] >= self.failure_threshold:
+                if not self._state[1]:
+                    _log.debug("Circuit opened")
+                self._state[1] = time.monotonic()
+
+
+class AdaptiveLimiter:
+    """Concurrency window that follows the observed latency
+
+    limiter = AdaptiveLimiter()
+    client = PyAsyncCAI('TOKEN', limiter=limiter)
+    limiter.limit
+
+    The window grows by one slot per window's worth of successful
+    calls while the smoothed latency stays within `tolerance` of the
+    best latency seen, and is cut by `backoff` when latency rises or a
+    call is dropped (timeout, 429, server error).
+
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        *,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        tolerance: float = 1.5,
+        backoff: float = 0.7,
+        smoothing: float = 0.2,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+
+        self._limit = float(initial)
+        self.inflight = 0
+        self.latency = None
+        self.best_latency = None
+        self.dropped = 0
+        self._last_decrease = 0
+        self._waiters = deque()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    async def acquire(self):
+        if self.inflight < self.limit and not self._waiters:
+            self.inflight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was already handed over, pass it on
+                self.inflight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency: float = None, *, dropped: bool = False):
+        self.inflight -= 1
+        now = time.monotonic()
+
+        if dropped:
+            self.dropped += 1
+            self._decrease(now)
+        elif latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.smoothing * (latency - self.latency)
+            if self.best_latency is None or latency < self.best_latency:
+                self.best_latency = latency
+            else:
+                # let the baseline drift up slowly so one lucky call does
+                # not pin the window low forever
+                self.best_latency += 0.001 * (latency - self.best_latency)
+
+            if self.latency > self.best_latency * self.tolerance:
+                self._decrease(now)
+            elif self.inflight + 1 >= self.limit:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException:
+            self.release(dropped=True)
+            raise
+        else:
+            self.release(time.monotonic() - start)
+
+    def _decrease(self, now: float):
+        # one cut per round trip, a burst of failures is one signal
+        if now - self._last_decrease < (self.latency or 0):
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * self.backoff)
+        _log.debug(f"Concurrency limit lowered to {self.limit}")
+
+    def _wake(self):
+        while self._waiters and self.inflight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
@@ -0,0 +1,156 @@
+import asyncio
+
+from characterai import errors
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["RoomEngine"]
+
+POLICIES = ("round_robin", "all_at_once", "first_responder")
+
+
+def _participant_tgt(participant):
+    if isinstance(participant, str):
+        return participant
+    if participant.get("is_human"):
+        return None
+    user = participant.get("user") or {}
+    return user.get("username") or participant.get("username")
+
+
+class RoomEngine:
+    """Drives the characters of a room created with chat.create_room
+
+    room = RoomEngine(client, 'ROOM_ID', participants)
+    async for tgt, reply in room.round('TEXT'):
+        print(reply['replies'][0]['text'])
+
+    participants are tgt usernames or the participant dicts of the room.
+    The user message is posted once, to a lead character that rotates
+    from round to round. Policies:
+        round_robin      every character answers in turn, each seeing the
+                         replies before it
+        all_at_once      every character answers the message, replies
+                         are yielded as they arrive
+        first_responder  every character starts on the message, only the
+                         first reply is yielded and the rest are cancelled
+
+    Characters after the lead in a round_robin round are prompted with
+    `continue_text`, which must not be empty, so they react to the room
+    instead of the user message being repeated. Under the other
+    policies every character runs in one task set: the others wait for
+    the id of the posted user message and reply to it through
+    chat.next_message without a new human turn. The id comes with the
+    lead's HTTP reply, so they start as soon as that arrives.
+
+    """
+
+    def __init__(
+        self,
+        client,
+        room_id: str,
+        participants: list,
+        *,
+        policy: str = "round_robin",
+        continue_text: str = "(continue)",
+        token: str = None,
+    ):
+        if not continue_text:
+            raise ValueError("continue_text must not be empty")
+        self.client = client
+        self.room_id = room_id
+        self.policy = self._policy(policy)
+        self.continue_text = continue_text
+        self.token = token
+        self.characters = [
+            tgt for tgt in map(_participant_tgt, participants) if tgt is not None
+        ]
+        if not self.characters:
+            raise errors.PyCAIError("Room has no characters")
+        self._turn = 0
+
+    @classmethod
+    def from_room(cls, client, room: dict, **kwargs):
+        """Engine for a create_room or get_chat response"""
+        room = room.get("room", room)
+        return cls(
+            client, room["external_id"], room.get("participants") or [], **kwargs
+        )
+
+    @staticmethod
+    def _policy(policy: str):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        return policy
+
+    async def _reply(self, tgt: str, text: str, **kwargs):
+        _log.debug(f"Room {self.room_id}: asking {tgt}")
+        response = await self.client.chat.send_message(
+            self.room_id, tgt, text, token=self.token, **kwargs
+        )
+        return tgt, response
+
+    async def _lead(self, tgt: str, text: str, posted, **kwargs):
+        """_reply() that resolves posted with the id of the user message"""
+        user_msg_uuid = None
+        try:
+            tgt, response = await self._reply(tgt, text, **kwargs)
+            user_msg_uuid = response.get("last_user_msg_uuid")
+            return tgt, response
+        finally:
+            if not posted.done():
+                posted.set_result(user_msg_uuid)
+
+    async def _follow(self, tgt: str, posted, **kwargs):
+        parent_msg_uuid = await asyncio.shield(posted)
+        if parent_msg_uuid is None:
+            raise errors.ServerError("The user message was not posted")
+        _log.debug(f"Room {self.room_id}: asking {tgt} to follow up")
+        response = await self.client.chat.next_message(
+            self.room_id, parent_msg_uuid, tgt, token=self.token, **kwargs
+        )
+        return tgt, response
+
+    async def round(self, text: str, *, policy: str = None, **kwargs):
+        """One room round, yields (tgt, response) as replies arrive"""
+        policy = self._policy(policy or self.policy)
+        start = self._turn % len(self.characters)
+        self._turn += 1
+        order = self.characters[start:] + self.characters[:start]
+
+        if policy == "round_robin":
+            for n, tgt in enumerate(order):
+                yield await self._reply(
+                    tgt, text if n == 0 else self.continue_text, **kwargs
+                )
+            return
+
+        posted = asyncio.get_running_loop().create_future()
+        tasks = [asyncio.ensure_future(self._lead(order[0], text, posted, **kwargs))]
+        tasks += [
+            asyncio.ensure_future(self._follow(tgt, posted, **kwargs))
+            for tgt in order[1:]
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except Exception as e:
+                    if policy == "first_responder":
+                        _log.debug(f"Room {self.room_id}: a responder failed: {e!r}")
+                        continue
+                    raise
+                yield result
+                if policy == "first_responder":
+                    return
+            if policy == "first_responder":
+                raise errors.ServerError("No character responded")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def replies(self, text: str, **kwargs):
+        """Collect a whole round as a list of (tgt, response)"""
+        return [reply async for reply in self.round(text, **kwargs)]
@@ -0,0 +1,450 @@
+from collections import OrderedDict
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from characterai import errors, protocol, streaming
+from characterai.buffers import BoundedBuffer
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["FrameRouter", "Channel", "Subscription"]
+
+_REQUEST_ID = re.compile(r'"request_id"\s*:\s*"([^"]*)"')
+_TURN_ID = re.compile(r'"turn_id"\s*:\s*"([^"]*)"')
+
+
+def new_request_id():
+    return str(uuid.uuid4())
+
+
+def frame_turn_id(raw):
+    """turn_id of a raw or decoded turn frame, None for other frames"""
+    if isinstance(raw, dict):
+        turn = raw.get("turn")
+        if not isinstance(turn, dict):
+            return None
+        return (turn.get("turn_key") or {}).get("turn_id")
+    if '"turn"' not in raw:
+        return None
+    match = _TURN_ID.search(raw)
+    return match.group(1) if match else None
+
+
+def turn_key(frame: dict):
+    """(chat_id, turn_id) of a decoded turn frame"""
+    key = frame["turn"].get("turn_key") or {}
+    return key.get("chat_id"), key.get("turn_id")
+
+
+class Channel:
+    """Frames addressed to one outstanding command
+
+    Frames are raw text, or the decoded dict when a subscription made
+    the router decode the frame already; protocol.load_frame takes both.
+
+    Frames wait in a buffer of the router's `maxsize` and `policy`.
+    Turn frames are full snapshots of the turn so far, so coalescing
+    keeps the latest frame of a turn and loses no text; other frames
+    are never coalesced.
+
+    """
+
+    def __init__(
+        self,
+        router,
+        request_id: str,
+        chat_id: str = None,
+        *,
+        maxsize: int = 64,
+        policy: str = "coalesce",
+    ):
+        self.router = router
+        self.request_id = request_id
+        self.chat_id = chat_id
+        self.queue = BoundedBuffer(maxsize, policy, key=frame_turn_id)
+        self.opened_at = time.monotonic()
+        self.first_at = None
+        self.closed = False
+        self.on_close = None
+        self.span = None
+        self.deadline = None
+        self.command = None
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    @property
+    def latency(self):
+        """Seconds until the first reply frame, or so far"""
+        return (self.first_at or time.monotonic()) - self.opened_at
+
+    async def recv(self):
+        if self.deadline is None:
+            frame = await self.queue.get()
+        else:
+            remaining = self.deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                frame = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                raise errors.TimeoutError(
+                    f"No reply to {self.request_id} before the deadline"
+                ) from None
+        if isinstance(frame, BaseException):
+            raise frame
+        return frame
+
+    def close(self, *, failed: bool = False):
+        if self.closed:
+            return
+        self.closed = True
+        self.router._close(self)
+        # release the reader if it waits for room in this channel
+        self.queue.close()
+        if self.span is not None:
+            self.span.end(failed=failed)
+        if self.on_close is not None:
+            self.on_close(self, failed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # cancellation and generator exit are not failures of the command
+        self.close(failed=exc_type is not None and issubclass(exc_type, Exception))
+        return False
+
+
+_CLOSED = object()
+
+
+class Subscription:
+    """Decoded turn frames of the chats matching a filter
+
+    async for frame in chat2.subscribe(character_id='CHAR'):
+        ...
+
+    With a handler a task awaits handler(frame) for every frame
+    instead. Frames are buffered up to `maxsize`; when the buffer is
+    full, policy 'drop' discards the new frame and counts it in
+    `dropped`, 'coalesce' replaces the buffered snapshot of the same
+    turn, and 'block' makes the reader wait for the subscriber,
+    holding back the replies of every command on the socket. Frames
+    are shared between subscribers and with the command they answer,
+    and must not be modified.
+
+    """
+
+    def __init__(
+        self,
+        router,
+        *,
+        chat_id: str = None,
+        character_id: str = None,
+        final: bool = False,
+        handler=None,
+        maxsize: int = 100,
+        policy: str = "drop",
+    ):
+        self.router = router
+        self.chat_id = chat_id
+        self.character_id = character_id
+        self.final = final
+        self.queue = BoundedBuffer(maxsize, policy, key=turn_key)
+        self.closed = False
+        self.error = None
+        self._worker = None
+        if handler is not None:
+            self._worker = asyncio.ensure_future(self._run(handler))
+
+    def matches(self, character_id: str, final: bool):
+        if self.character_id is not None and character_id != self.character_id:
+            return False
+        return final or not self.final
+
+    @property
+    def policy(self):
+        return self.queue.policy
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    async def put(self, frame: dict):
+        await self.queue.put(frame)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            frame = _CLOSED
+        else:
+            frame = await self.queue.get()
+        if frame is _CLOSED:
+            if self.error is not None:
+                raise self.error
+            raise StopAsyncIteration
+        return frame
+
+    async def _run(self, handler):
+        try:
+            async for frame in self:
+                try:
+                    await handler(frame)
+                except Exception as e:
+                    _log.debug(f"Turn handler failed: {e!r}")
+        except Exception as e:
+            _log.debug(f"Subscription ended: {e!r}")
+
+    def close(self):
+        if self.closed:
+            return
+        # nobody reads a closed subscription, do not let it block the reader
+        self.queue.close()
+        self._end()
+
+    def _end(self, error: BaseException = None):
+        """Stop after the buffered frames, raising error if given"""
+        if self.closed:
+            return
+        self.closed = True
+        self.error = error
+        self.router._unsubscribe(self)
+        self.queue.put_nowait(_CLOSED, force=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class FrameRouter:
+    """Single reader that hands websocket frames to the command awaiting them
+
+    Commands carry a request_id; replies are matched on it and, when the
+    server does not echo it, on the chat_id of the frame. Several chat2
+    calls can therefore share one socket concurrently. Frames nobody is
+    waiting for are dropped without being decoded, as are late frames
+    of a command that was already closed, so an abandoned generation
+    cannot leak into the next command of its chat.
+
+    Subscriptions see every turn frame read from the socket, whether
+    or not a command awaits it. A frame is only decoded when some
+    subscription could want it, and then once for all of them and the
+    command it belongs to. Frames that are not valid JSON are skipped
+    for subscriptions and left to the command to fail on. The
+    character of a chat is known from the commands sent on it and from
+    the character turns seen, so a character_id filter only matches
+    chats this connection has seen one of those on.
+
+    Every channel buffers at most `maxsize` frames with the overflow
+    `policy` of BoundedBuffer. With 'block' or a frame that cannot be
+    coalesced, the reader waits for the slow caller and the socket's
+    own bounded receive queue fills up behind it, so memory per
+    connection stays bounded whatever the consumers do.
+
+    """
+
+    retired_size = 1024
+    characters_size = 4096
+
+    def __init__(
+        self, ws, *, maxsize: int = 64, policy: str = "coalesce", traffic=None
+    ):
+        if policy not in BoundedBuffer.policies:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.ws = ws
+        self.traffic = traffic
+        self.maxsize = maxsize
+        self.policy = policy
+        self._by_request = {}
+        self._by_chat = {}
+        self._retired = OrderedDict()
+        self._characters = OrderedDict()
+        self._subscriptions = []
+        self._reader = None
+        self.closed = None
+
+    def open(
+        self, request_id: str = None, chat_id: str = None, character_id: str = None
+    ):
+        if self._reader is None:
+            self.start()
+        if self._reader.done():
+            raise self.closed
+
+        if chat_id is not None and character_id is not None:
+            self._note(chat_id, character_id)
+        channel = Channel(
+            self,
+            request_id or new_request_id(),
+            chat_id,
+            maxsize=self.maxsize,
+            policy=self.policy,
+        )
+        self._by_request[channel.request_id] = channel
+        if chat_id is not None:
+            self._by_chat.setdefault(chat_id, []).append(channel)
+        return channel
+
+    def subscribe(self, **kwargs):
+        """Subscription to turn frames, see Subscription for the options"""
+        if self._reader is None:
+            self.start()
+        if self._reader.done():
+            raise self.closed
+        subscription = Subscription(self, **kwargs)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        try:
+            self._subscriptions.remove(subscription)
+        except ValueError:
+            pass
+
+    def _note(self, chat_id: str, character_id: str):
+        self._characters[chat_id] = character_id
+        self._characters.move_to_end(chat_id)
+        if len(self._characters) > self.characters_size:
+            self._characters.popitem(last=False)
+
+    def start(self):
+        if self._reader is None:
+            self._reader = asyncio.ensure_future(self._read())
+
+    async def stop(self):
+        if self._reader is not None and not self._reader.done():
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def pending(self):
+        return len(self._by_request)
+
+    @property
+    def depth(self):
+        """Frames buffered in channels and subscriptions"""
+        return sum(c.depth for c in self._by_request.values()) + sum(
+            s.depth for s in self._subscriptions
+        )
+
+    def _close(self, channel: Channel):
+        self._by_request.pop(channel.request_id, None)
+        self._retired[channel.request_id] = None
+        if len(self._retired) > self.retired_size:
+            self._retired.popitem(last=False)
+        channels = self._by_chat.get(channel.chat_id)
+        if channels is not None:
+            try:
+                channels.remove(channel)
+            except ValueError:
+                pass
+            if not channels:
+                del self._by_chat[channel.chat_id]
+
+    async def route(self, raw: str, frame: dict = None):
+        """Deliver one raw frame, or its decoded frame when given
+
+        Returns the receiving channel or None.
+        """
+        channel = None
+        match = _REQUEST_ID.search(raw)
+        if match is not None:
+            channel = self._by_request.get(match.group(1))
+            if channel is None and match.group(1) in self._retired:
+                _log.debug("Dropping frame of a closed command")
+                return None
+        if channel is None:
+            chat_id = streaming.frame_chat_id(raw)
+            channels = self._by_chat.get(chat_id)
+            if channels:
+                channel = channels[0]
+            elif chat_id is None and match is None and self._by_request:
+                # unaddressed frames (bare errors) go to the oldest command
+                channel = next(iter(self._by_request.values()))
+        if self.traffic is not None:
+            command = channel.command if channel is not None else None
+            self.traffic.frame(f"ws/{command or ''}", len(raw))
+        if channel is None:
+            _log.debug("Dropping frame nobody is waiting for")
+            return None
+        if channel.first_at is None:
+            channel.first_at = time.monotonic()
+        await channel.queue.put(raw if frame is None else frame)
+        return channel
+
+    def _targets(self, chat_id: str):
+        return [
+            s for s in self._subscriptions if s.chat_id is None or s.chat_id == chat_id
+        ]
+
+    def _decode(self, raw: str):
+        """Decoded turn frame if a subscription could want it, else None"""
+        if '"turn"' not in raw or not self._targets(streaming.frame_chat_id(raw)):
+            return None
+        try:
+            frame = json.loads(raw)
+        except ValueError as e:
+            _log.debug(f"Skipping a malformed frame: {e!r}")
+            return None
+        return frame if isinstance(frame, dict) else None
+
+    async def publish(self, frame: dict):
+        """Fan one decoded frame out to the subscriptions it matches"""
+        turn = frame.get("turn")
+        if not isinstance(turn, dict):
+            return
+        chat_id = streaming.frame_chat_id(frame)
+        targets = self._targets(chat_id)
+        if not targets:
+            return
+
+        author_id = (turn.get("author") or {}).get("author_id")
+        if chat_id is not None and isinstance(author_id, str):
+            if author_id and not author_id.isdigit():
+                self._note(chat_id, author_id)
+        character_id = self._characters.get(chat_id)
+        final = protocol.is_final_turn(frame)
+        for subscription in targets:
+            if not subscription.closed and subscription.matches(character_id, final):
+                await subscription.put(frame)
+
+    async def _read(self):
+        stopped = False
+        try:
+            while True:
+                raw = await self.ws.recv()
+                frame = self._decode(raw) if self._subscriptions else None
+                await self.route(raw, frame)
+                if frame is not None:
+                    await self.publish(frame)
+        except asyncio.CancelledError:
+            stopped = True
+            self.closed = ConnectionError("Router stopped")
+            raise
+        except Exception as e:
+            _log.debug(f"Websocket reader stopped: {e!r}")
+            self.closed = e
+        finally:
+            for channel in list(self._by_request.values()):
+                channel.queue.put_nowait(self.closed, force=True)
+            for subscription in list(self._subscriptions):
+                subscription._end(None if stopped else self.closed)
@@ -0,0 +1,358 @@
+from bisect import bisect
+import asyncio
+import hashlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import threading
+
+from characterai import errors
+from characterai.ratelimit import CircuitBreaker, SharedRateLimiter
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["HashRing", "ShardedCAI"]
+
+_STOP = None
+
+
+def _hash(key: str):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash of keys onto a fixed set of nodes"""
+
+    def __init__(self, nodes, replicas: int = 64):
+        points = []
+        for node in nodes:
+            for replica in range(replicas):
+                points.append((_hash(f"{node}-{replica}"), node))
+        points.sort()
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: str):
+        index = bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._nodes[index]
+
+
+def _picklable(error: BaseException):
+    try:
+        pickle.dumps(error)
+    except Exception:
+        return errors.PyCAIError(repr(error))
+    return error
+
+
+def _worker(index, token, plus, inbox, outbox, limiter, breaker, concurrency):
+    asyncio.run(
+        _serve(index, token, plus, inbox, outbox, limiter, breaker, concurrency)
+    )
+
+
+async def _serve(index, token, plus, inbox, outbox, limiter, breaker, concurrency):
+    from characterai.pyasynccai import PyAsyncCAI
+
+    loop = asyncio.get_running_loop()
+    jobs = asyncio.Queue()
+    slots = asyncio.Semaphore(concurrency)
+
+    def pump():
+        while True:
+            job = inbox.get()
+            loop.call_soon_threadsafe(jobs.put_nowait, job)
+            if job is _STOP:
+                return
+
+    threading.Thread(target=pump, daemon=True).start()
+
+    async def run(chat2, job):
+        job_id, method, args, kwargs, stream = job
+        try:
+            if limiter is not None:
+                await limiter.acquire()
+            if stream:
+                async for delta in getattr(chat2, method)(*args, **kwargs):
+                    outbox.put((job_id, "delta", delta))
+                result = None
+            else:
+                result = await getattr(chat2, method)(*args, **kwargs)
+        except Exception as e:
+            if breaker is not None and not isinstance(
+                e, (errors.AuthError, errors.LabelError, errors.PostTypeError)
+            ):
+                breaker.record_failure()
+            outbox.put((job_id, "error", _picklable(e)))
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            outbox.put((job_id, "result", result))
+        finally:
+            slots.release()
+
+    async with PyAsyncCAI(token, plus) as client:
+        job = None
+        backoff = 0.5
+        while True:
+            try:
+                async with client.connect() as chat2:
+                    _log.debug(f"Worker {index} connected")
+                    backoff = 0.5
+                    while True:
+                        if job is None:
+                            job = await jobs.get()
+                        if job is _STOP:
+                            for _ in range(concurrency):
+                                await slots.acquire()
+                            return
+                        if chat2.router.closed is not None:
+                            break
+                        await slots.acquire()
+                        asyncio.ensure_future(run(chat2, job))
+                        job = None
+            except Exception as e:
+                _log.debug(f"Worker {index} lost its connection: {e!r}")
+                if job is not None and job is not _STOP:
+                    outbox.put((job[0], "error", _picklable(e)))
+                    job = None
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+class ShardedCAI:
+    """chat2 spread over several worker processes
+
+    async with ShardedCAI('TOKEN', workers=4) as cai:
+        await cai.chat2.send_message('CHAR', 'CHAT_ID', 'TEXT', {AUTHOR})
+
+    Each worker owns one websocket. Calls are routed by a consistent
+    hash of chat_id (or of the character for calls without one), so a
+    chat always stays on the same socket. The rate limit and the
+    circuit breaker live in shared memory and apply to all workers.
+
+    """
+
+    def __init__(
+        self,
+        token: str = None,
+        *,
+        plus: bool = False,
+        workers: int = None,
+        concurrency: int = 64,
+        rate: float = None,
+        burst: float = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        replicas: int = 64,
+    ):
+        self.token = token
+        self.plus = plus
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency
+
+        self._context = multiprocessing.get_context("spawn")
+        self.limiter = (
+            SharedRateLimiter(rate, burst, context=self._context)
+            if rate is not None
+            else None
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold, reset_timeout, context=self._context
+        )
+        self.ring = HashRing(range(self.workers), replicas)
+
+        self._inboxes = []
+        self._processes = []
+        self._outbox = None
+        self._collector = None
+        self._loop = None
+        self._pending = {}
+        self._ids = itertools.count()
+
+        self.chat2 = self.chat2(self)
+
+    async def start(self):
+        if self._processes:
+            return
+        _log.debug(f"Starting {self.workers} workers")
+        self._loop = asyncio.get_running_loop()
+        self._outbox = self._context.Queue()
+        for index in range(self.workers):
+            inbox = self._context.Queue()
+            process = self._context.Process(
+                target=_worker,
+                args=(
+                    index,
+                    self.token,
+                    self.plus,
+                    inbox,
+                    self._outbox,
+                    self.limiter,
+                    self.breaker,
+                    self.concurrency,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    async def close(self):
+        if not self._processes:
+            return
+        _log.debug("Stopping workers")
+        for inbox in self._inboxes:
+            inbox.put(_STOP)
+        for process in self._processes:
+            await self._loop.run_in_executor(None, process.join, 10)
+            if process.is_alive():
+                process.terminate()
+        self._outbox.put(_STOP)
+        await self._loop.run_in_executor(None, self._collector.join)
+
+        for queue in self._pending.values():
+            queue.put_nowait(("error", errors.PyCAIError("Workers stopped")))
+        self._pending.clear()
+        self._inboxes.clear()
+        self._processes.clear()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    def worker_for(self, key: str):
+        return self.ring.node(key)
+
+    def _collect(self):
+        while True:
+            message = self._outbox.get()
+            if message is _STOP:
+                return
+            self._loop.call_soon_threadsafe(self._deliver, message)
+
+    def _deliver(self, message):
+        job_id, kind, payload = message
+        queue = self._pending.get(job_id)
+        if queue is not None:
+            queue.put_nowait((kind, payload))
+
+    def _submit(self, key: str, method: str, args, kwargs, stream: bool = False):
+        if not self._processes:
+            raise errors.PyCAIError("ShardedCAI is not started")
+        self.breaker.check()
+
+        job_id = next(self._ids)
+        queue = asyncio.Queue()
+        self._pending[job_id] = queue
+        self._inboxes[self.worker_for(key)].put(
+            (job_id, method, args, kwargs, stream)
+        )
+        return job_id, queue
+
+    async def call(self, key: str, method: str, *args, **kwargs):
+        job_id, queue = self._submit(key, method, args, kwargs)
+        try:
+            kind, payload = await queue.get()
+        finally:
+            self._pending.pop(job_id, None)
+        if kind == "error":
+            raise payload
+        return payload
+
+    async def stream(self, key: str, method: str, *args, **kwargs):
+        job_id, queue = self._submit(key, method, args, kwargs, stream=True)
+        try:
+            while True:
+                kind, payload = await queue.get()
+                if kind == "delta":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+        finally:
+            self._pending.pop(job_id, None)
+
+    class chat2:
+        """Same calls as PyAsyncCAI.chat2, routed to the owning worker
+
+        chat2.send_message('CHAR', 'CHAT_ID', 'TEXT', {AUTHOR})
+        chat2.stream_message('CHAR', 'CHAT_ID', 'TEXT', {AUTHOR})
+        chat2.next_message('CHAR', 'CHAT_ID', 'PARENT_ID')
+        chat2.stream_next_message('CHAR', 'CHAT_ID', 'PARENT_ID')
+        chat2.new_chat('CHAR', 'CHAT_ID', 'CREATOR_ID')
+        chat2.get_histories('CHAR')
+        chat2.get_chat('CHAR')
+        chat2.get_history('CHAT_ID')
+        chat2.rate(RATE, 'CHAT_ID', 'TURN_ID', 'CANDIDATE_ID')
+        chat2.delete_message('CHAT_ID', 'TURN_ID')
+
+        """
+
+        def __init__(self, sharded):
+            self.sharded = sharded
+
+        async def next_message(
+            self, char: str, chat_id: str, parent_msg_uuid: str, **kwargs
+        ):
+            return await self.sharded.call(
+                chat_id, "next_message", char, chat_id, parent_msg_uuid, **kwargs
+            )
+
+        def stream_next_message(
+            self, char: str, chat_id: str, parent_msg_uuid: str, **kwargs
+        ):
+            return self.sharded.stream(
+                chat_id, "stream_next_message", char, chat_id, parent_msg_uuid, **kwargs
+            )
+
+        async def send_message(
+            self, char: str, chat_id: str, text: str, author: dict = None, **kwargs
+        ):
+            return await self.sharded.call(
+                chat_id, "send_message", char, chat_id, text, author, **kwargs
+            )
+
+        def stream_message(
+            self, char: str, chat_id: str, text: str, author: dict = None, **kwargs
+        ):
+            return self.sharded.stream(
+                chat_id, "stream_message", char, chat_id, text, author, **kwargs
+            )
+
+        async def new_chat(self, char: str, chat_id: str, creator_id: str, **kwargs):
+            return await self.sharded.call(
+                chat_id, "new_chat", char, chat_id, creator_id, **kwargs
+            )
+
+        async def get_histories(self, char: str = None, **kwargs):
+            return await self.sharded.call(char, "get_histories", char, **kwargs)
+
+        async def get_chat(self, char: str = None, **kwargs):
+            return await self.sharded.call(char, "get_chat", char, **kwargs)
+
+        async def get_history(self, chat_id: str = None, **kwargs):
+            return await self.sharded.call(chat_id, "get_history", chat_id, **kwargs)
+
+        async def rate(
+            self, rate: int, chat_id: str, turn_id: str, candidate_id: str, **kwargs
+        ):
+            return await self.sharded.call(
+                chat_id, "rate", rate, chat_id, turn_id, candidate_id, **kwargs
+            )
+
+        async def delete_message(self, chat_id: str, turn_ids: list, **kwargs):
+            return await self.sharded.call(
+                chat_id, "delete_message", chat_id, turn_ids, **kwargs
+            )
@@ -0,0 +1,162 @@
+import re
+
+__all__ = ["CandidateBuffer", "TurnDelta", "TurnStream"]
+
+_AUTHOR_ID = re.compile(r'"author_id"\s*:\s*"([^"]*)"')
+_CHAT_ID = re.compile(r'"chat_id"\s*:\s*"([^"]*)"')
+
+
+def _turn(frame: dict):
+    turn = frame.get("turn")
+    return turn if isinstance(turn, dict) else None
+
+
+def frame_chat_id(raw):
+    """chat_id of a raw websocket frame without decoding it"""
+    if isinstance(raw, dict):
+        turn = _turn(raw)
+        return (turn.get("turn_key") or {}).get("chat_id") if turn else None
+    match = _CHAT_ID.search(raw)
+    return match.group(1) if match else None
+
+
+def is_foreign_frame(raw, chat_id: str = None):
+    """True for turn frames that can be skipped without decoding
+
+    Those are echoes of the human turn (numeric author_id) and turns
+    from another chat. Frames without a turn are never foreign, they
+    carry errors the caller has to see. raw may also be a frame the
+    router decoded already.
+
+    """
+    if isinstance(raw, dict):
+        turn = _turn(raw)
+        if turn is None:
+            return False
+        other = frame_chat_id(raw)
+        if chat_id is not None and other is not None and other != chat_id:
+            return True
+        author_id = (turn.get("author") or {}).get("author_id")
+        return isinstance(author_id, str) and author_id.isdigit()
+    if '"turn"' not in raw:
+        return False
+    if chat_id is not None:
+        other = frame_chat_id(raw)
+        if other is not None and other != chat_id:
+            return True
+    match = _AUTHOR_ID.search(raw)
+    return match is not None and match.group(1).isdigit()
+
+
+class TurnDelta:
+    """New text of one candidate since the previous frame
+
+    `turn` is only set on the final delta of a candidate.
+
+    """
+
+    __slots__ = ("turn_id", "candidate_id", "text", "is_final", "reset", "turn")
+
+    def __init__(self, turn_id, candidate_id, text, is_final, reset, turn=None):
+        self.turn_id = turn_id
+        self.candidate_id = candidate_id
+        self.text = text
+        self.is_final = is_final
+        self.reset = reset
+        self.turn = turn
+
+    def __repr__(self):
+        return (
+            f"TurnDelta(candidate_id={self.candidate_id!r}, "
+            f"text={self.text!r}, is_final={self.is_final})"
+        )
+
+
+class CandidateBuffer:
+    """Growing text of a single candidate
+
+    Every frame carries the whole text so far, so the latest one is
+    kept as is; nothing is joined or copied beyond the new tail.
+    """
+
+    __slots__ = ("candidate_id", "text", "is_final")
+
+    def __init__(self, candidate_id: str):
+        self.candidate_id = candidate_id
+        self.text = ""
+        self.is_final = False
+
+    @property
+    def length(self):
+        return len(self.text)
+
+    def feed(self, raw_content: str):
+        """Returns (delta, reset), reset is True if the server rewrote the text"""
+        length = len(self.text)
+        # compares in place, without slicing out the old prefix
+        if not raw_content.startswith(self.text):
+            self.text = raw_content
+            return raw_content, True
+
+        delta = raw_content[length:]
+        self.text = raw_content
+        return delta, False
+
+
+class TurnStream:
+    """Turns successive `turn` frames into per-candidate text deltas
+
+    stream = TurnStream()
+    for delta in stream.feed(response['turn']):
+        print(delta.text, end='')
+
+    """
+
+    def __init__(self):
+        self.turn_id = None
+        self.candidates = {}
+
+    def text(self, candidate_id: str = None):
+        if candidate_id is None:
+            if not self.candidates:
+                return ""
+            candidate_id = next(iter(self.candidates))
+        return self.candidates[candidate_id].text
+
+    @property
+    def is_final(self):
+        return bool(self.candidates) and all(
+            buffer.is_final for buffer in self.candidates.values()
+        )
+
+    def feed(self, turn: dict):
+        turn_id = (turn.get("turn_key") or {}).get("turn_id")
+        if turn_id != self.turn_id:
+            self.turn_id = turn_id
+            self.candidates.clear()
+
+        deltas = []
+        for candidate in turn.get("candidates") or ():
+            candidate_id = candidate.get("candidate_id")
+            buffer = self.candidates.get(candidate_id)
+            if buffer is None:
+                buffer = self.candidates[candidate_id] = CandidateBuffer(candidate_id)
+            elif buffer.is_final:
+                continue
+
+            delta, reset = buffer.feed(candidate.get("raw_content") or "")
+            is_final = "is_final" in candidate
+            if is_final:
+                buffer.is_final = True
+            if delta or reset or is_final:
+                deltas.append(
+                    TurnDelta(
+                        turn_id,
+                        candidate_id,
+                        delta,
+                        is_final,
+                        reset,
+                        turn if is_final else None,
+                    )
+                )
+        return deltas
@@ -0,0 +1,115 @@
+import json
+import threading
+
+from characterai.profiling import endpoint_name
+from characterai.protocol import header
+
+__all__ = ["Traffic"]
+
+
+class Traffic:
+    """Bytes sent and received per endpoint, compressed and decoded
+
+    traffic = Traffic()
+    client = PyAsyncCAI('TOKEN', traffic=traffic)
+    ...
+    print(traffic.report())
+
+    The body of a response arrives decompressed from tls_client, so
+    its size on the wire is taken from Content-Length when the server
+    sent a Content-Encoding; chunked responses have no wire size and
+    only count as decoded. Websocket frames are counted decoded, both
+    ways, under 'ws/' and the command name: permessage-deflate happens
+    inside websockets and its compressed sizes are not exposed.
+
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, endpoint: str):
+        entry = self.stats.get(endpoint)
+        if entry is None:
+            entry = self.stats[endpoint] = {
+                "requests": 0,
+                "sent": 0,
+                "received": 0,
+                "measured": 0,
+                "wire": 0,
+                "encodings": {},
+            }
+        return entry
+
+    def observe(self, path: str, data, response):
+        """Account one HTTP request with body data and its response"""
+        if response is None:
+            return
+        sent = len(json.dumps(data)) if data is not None else 0
+        content = getattr(response, "content", None)
+        received = len(content) if content is not None else len(response.text)
+        encoding = header(response, "Content-Encoding") or "identity"
+        wire = None
+        if encoding != "identity":
+            length = header(response, "Content-Length")
+            if length is not None and str(length).isdigit():
+                wire = int(length)
+
+        with self._lock:
+            entry = self._entry(endpoint_name(path))
+            entry["requests"] += 1
+            entry["sent"] += sent
+            entry["received"] += received
+            if wire is not None:
+                entry["measured"] += received
+                entry["wire"] += wire
+            encodings = entry["encodings"]
+            encodings[encoding] = encodings.get(encoding, 0) + 1
+
+    def frame(self, endpoint: str, size: int, *, sent: bool = False):
+        """Account one websocket frame of size characters"""
+        with self._lock:
+            entry = self._entry(endpoint)
+            if sent:
+                entry["requests"] += 1
+                entry["sent"] += size
+            else:
+                entry["received"] += size
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {**entry, "encodings": dict(entry["encodings"])}
+                for endpoint, entry in self.stats.items()
+            }
+
+    def report(self):
+        """Plain text summary, most received bytes first"""
+        with self._lock:
+            stats = sorted(
+                self.stats.items(), key=lambda item: item[1]["received"], reverse=True
+            )
+            lines = []
+            for endpoint, entry in stats:
+                line = (
+                    f"{endpoint}: {entry['requests']} requests, "
+                    f"{entry['sent']} B sent, {entry['received']} B received"
+                )
+                if entry["measured"]:
+                    saved = 1 - entry["wire"] / entry["measured"]
+                    line += (
+                        f", {entry['wire']} B on the wire for "
+                        f"{entry['measured']} B decoded ({saved:.0%} saved)"
+                    )
+                encodings = ", ".join(
+                    f"{name} {count}"
+                    for name, count in sorted(entry["encodings"].items())
+                )
+                if encodings:
+                    line += f" [{encodings}]"
+                lines.append(line)
+            return "\n".join(lines)
@@ -0,0 +1,154 @@
+from collections import deque
+import asyncio
+import time
+import uuid
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = ["WarmPool"]
+
+
+class WarmPool:
+    """Chats created ahead of time, handed out without a round trip
+
+    async with client.connect() as chat2:
+        pool = WarmPool(client, chat2=chat2, size=3)
+        pool.warm('CHAR', 'CREATOR_ID')
+        response, answer = await pool.new_chat2('CHAR', 'CREATOR_ID')
+        history = await pool.new_chat('CHAR')
+        await pool.close()
+
+    new_chat2 returns the same (response, answer) pair as
+    chat2.new_chat, greeting included, and new_chat the response of
+    the legacy chat.new_chat. A chat taken from the pool is replaced in
+    the background; when the pool is empty the chat is created on the
+    spot. Only the characters passed to warm() are kept ready, other
+    calls just create their chat. Chats older than `max_age` are dropped instead of handed out,
+    since a stale greeting may no longer match the character. There is
+    no endpoint to delete a chat, so dropped chats stay on the account
+    unused.
+
+    """
+
+    def __init__(
+        self,
+        client,
+        *,
+        chat2=None,
+        size: int = 2,
+        max_age: float = 3600,
+        concurrency: int = 4,
+        token: str = None,
+    ):
+        self.client = client
+        self.chat2 = chat2
+        self.size = size
+        self.max_age = max_age
+        self.token = token
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+        self._ready = {}
+        self._refills = {}
+        self._slots = None
+        self._concurrency = concurrency
+        self._closed = False
+
+    def __len__(self):
+        return sum(map(len, self._ready.values()))
+
+    def warm(self, char: str, creator_id: str = None):
+        """Start keeping chats ready, chat2 ones when creator_id is given"""
+        key = ("chat2", char, creator_id) if creator_id else ("chat", char)
+        self._ready.setdefault(key, deque())
+        self._refill(key)
+
+    async def new_chat2(self, char: str, creator_id: str):
+        return await self._take(("chat2", char, creator_id))
+
+    async def new_chat(self, char: str):
+        return await self._take(("chat", char))
+
+    def prune(self):
+        """Drop every chat older than max_age, returns how many"""
+        dropped = 0
+        for key, ready in self._ready.items():
+            dropped += self._expire(ready)
+            self._refill(key)
+        return dropped
+
+    async def close(self):
+        self._closed = True
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refills.clear()
+        self._ready.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    def _expire(self, ready: deque):
+        dropped = 0
+        deadline = time.monotonic() - self.max_age
+        while ready and ready[0][0] < deadline:
+            ready.popleft()
+            dropped += 1
+        self.expired += dropped
+        return dropped
+
+    async def _take(self, key: tuple):
+        ready = self._ready.get(key)
+        if ready is None:
+            # not warmed, do not leave a pool of chats behind
+            self.misses += 1
+            return await self._create(key)
+
+        self._expire(ready)
+        if ready:
+            self.hits += 1
+            _, chat = ready.popleft()
+            self._refill(key)
+            return chat
+
+        self.misses += 1
+        self._refill(key)
+        return await self._create(key)
+
+    async def _create(self, key: tuple):
+        if key[0] == "chat2":
+            _, char, creator_id = key
+            return await self.chat2.new_chat(char, str(uuid.uuid4()), creator_id)
+        return await self.client.chat.new_chat(key[1], token=self.token)
+
+    def _refill(self, key: tuple):
+        if self._closed or key in self._refills:
+            return
+        if len(self._ready[key]) >= self.size:
+            return
+        self._refills[key] = asyncio.ensure_future(self._fill(key))
+
+    async def _fill(self, key: tuple):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._concurrency)
+        ready = self._ready[key]
+        try:
+            while len(ready) < self.size:
+                async with self._slots:
+                    chat = await self._create(key)
+                ready.append((time.monotonic(), chat))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _log.debug(f"Refilling warm pool for {key} failed: {e!r}")
+        finally:
+            self._refills.pop(key, None)
@@ -0,0 +1,22 @@
+from characterai.projection import project
+
+
+def test_nested_wildcard_keeps_empty_inner_arrays():
+    text = '{"h":[{"m":[{"t":1}]},{"m":[]},{"m":[{"t":3}]}]}'
+    assert project(text, ["h[*].m[*].t"]) == {"h[*].m[*].t": [[1], [], [3]]}
+
+
+def test_wildcard_over_empty_array():
+    assert project('{"h":[]}', ["h[*].m[*].t"]) == {"h[*].m[*].t": []}
+
+
+def test_nested_wildcard_keeps_items_without_the_leaf():
+    text = '{"h":[{"m":[{"t":1}]},{"m":[{"x":2}]},{"m":[{"t":3}]}]}'
+    assert project(text, ["h[*].m[*].t"]) == {"h[*].m[*].t": [[1], [], [3]]}
+
+
+def test_nested_wildcard_over_decoded_values():
+    # "h" is decoded whole for its own path, the wildcard then walks it
+    text = '{"h":[{"m":[{"t":1}]},{"m":[{"x":2}]},{"m":[]}]}'
+    found = project(text, ["h", "h[*].m[*].t"])
+    assert found["h[*].m[*].t"] == [[1], [], []]
@@ -0,0 +1,63 @@
+import asyncio
+
+from characterai.rooms import RoomEngine
+
+
+class FakeChat:
+    def __init__(self, delays):
+        self.delays = delays
+        self.calls = []
+        self.running = 0
+        self.overlap = 0
+        self.cancelled = []
+
+    async def _generate(self, tgt):
+        self.running += 1
+        self.overlap = max(self.overlap, self.running)
+        try:
+            await asyncio.sleep(self.delays[tgt])
+        except asyncio.CancelledError:
+            self.cancelled.append(tgt)
+            raise
+        finally:
+            self.running -= 1
+
+    async def send_message(self, room_id, tgt, text, *, token=None):
+        self.calls.append(("send", tgt, text))
+        await self._generate(tgt)
+        return {"replies": [{"text": tgt}], "last_user_msg_uuid": "USER"}
+
+    async def next_message(self, room_id, parent_msg_uuid, tgt, *, token=None):
+        self.calls.append(("next", tgt, parent_msg_uuid))
+        await self._generate(tgt)
+        return {"replies": [{"text": tgt}]}
+
+
+class FakeClient:
+    def __init__(self, delays):
+        self.chat = FakeChat(delays)
+
+
+def test_all_at_once_posts_once_and_overlaps_followers():
+    client = FakeClient({"a": 0.01, "b": 0.05, "c": 0.02})
+    room = RoomEngine(client, "ROOM", ["a", "b", "c"], policy="all_at_once")
+
+    replies = asyncio.run(room.replies("hi"))
+
+    assert [tgt for tgt, _ in replies] == ["a", "c", "b"]
+    sends = [call for call in client.chat.calls if call[0] == "send"]
+    assert sends == [("send", "a", "hi")]
+    assert ("next", "b", "USER") in client.chat.calls
+    assert ("next", "c", "USER") in client.chat.calls
+    assert client.chat.overlap == 2
+
+
+def test_first_responder_yields_one_reply_and_cancels_the_rest():
+    client = FakeClient({"a": 0.01, "b": 0.2, "c": 0.02})
+    room = RoomEngine(client, "ROOM", ["a", "b", "c"], policy="first_responder")
+
+    replies = asyncio.run(room.replies("hi"))
+
+    assert [tgt for tgt, _ in replies] == ["a"]
+    assert [call[0] for call in client.chat.calls].count("send") == 1
+    assert client.chat.running == 0